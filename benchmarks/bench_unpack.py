@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Compare throughput of transfer chunk sizes and gzip decompression backends
+
+Usage: python benchmarks/bench_unpack.py [size_in_MB]
+"""
+import os
+import sys
+import time
+import gzip
+import tempfile
+
+from lsru.decompress import DecompressingReader, available_decompressors
+
+
+def chunked(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def main(size_mb=256):
+    # Landsat surface reflectance bands compress roughly 3:1
+    block = os.urandom(1024 * 1024)
+    raw = b''.join(block[:350 * 1024] + b'\0' * (674 * 1024)
+                   for _ in range(size_mb))
+    compressed = gzip.compress(raw, compresslevel=6)
+    print('%d MB of data, %d MB compressed' % (size_mb, len(compressed) // 2**20))
+
+    print('\nWrite loop (compressed archive to disk)')
+    with tempfile.TemporaryFile() as dst:
+        for chunk_size in (1024, 64 * 1024, 1024 * 1024, 8 * 1024 * 1024):
+            dst.seek(0)
+            t0 = time.time()
+            for chunk in chunked(compressed, chunk_size):
+                dst.write(chunk)
+            dt = time.time() - t0
+            print('  chunk_size=%-8d %8.1f MB/s' % (chunk_size,
+                                                    len(compressed) / 2**20 / dt))
+
+    print('\nDecompression')
+    for name in available_decompressors():
+        for chunk_size in (1024, 1024 * 1024):
+            reader = DecompressingReader(chunked(compressed, chunk_size),
+                                         decompressor=name)
+            t0 = time.time()
+            n = 0
+            while True:
+                data = reader.read(1024 * 1024)
+                if not data:
+                    break
+                n += len(data)
+            dt = time.time() - t0
+            assert n == len(raw)
+            print('  %-8s chunk_size=%-8d %8.1f MB/s' % (name, chunk_size,
+                                                         size_mb / dt))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
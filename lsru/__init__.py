@@ -1,13 +1,17 @@
 import os
+import sys
 import json
+import time
 import datetime
 from pprint import pprint
 from configparser import ConfigParser
 import warnings
+from contextlib import closing
 
-import requests
-
-from .utils import url_retrieve, url_retrieve_and_unpack
+from .utils import (url_retrieve, url_retrieve_and_unpack, bounds,
+                    geom_from_metadata, iter_json_array, in_shard,
+                    FileClaim)
+from .spatial import STRtree, cluster_bounds, intersects
 
 __version__ = "0.6.2"
 
@@ -81,6 +85,9 @@ class Usgs(object):
         Return:
             bool: True if query was successful, False otherwise
         """
+        # requests is imported lazily to keep ``import lsru`` (and the command
+        # line interface) fast
+        import requests
         login_endpoint = '/'.join([self.endpoint, 'login'])
         r = requests.post(login_endpoint,
                           data={'jsonRequest': json.dumps({'username': self.USER,
@@ -127,9 +134,86 @@ class Usgs(object):
         Returns:
             list: List of scenes with complete metadata
         """
+        params = self._search_params(collection, bbox, begin, end,
+                                     max_cloud_cover, months, starting_number,
+                                     max_results)
+        import requests
+        r = requests.post('/'.join([self.endpoint, 'search']),
+                          data={'jsonRequest': json.dumps(params)})
+        return r.json()['data']['results']
+
+    def iter_search(self, collection, bbox, begin=None, end=None,
+                    max_cloud_cover=100, months=None, starting_number=1,
+                    max_results=50000, chunk_size=65536):
+        """Perform a spatio temporal query and iterate over the results as they arrive
+
+        Same as ``search``, except that the response is decoded incrementally
+        as it is received; scenes metadata are yielded one by one and the full
+        response is never held in memory. Useful for large queries, in
+        combination with ``lsru.catalog.write_catalog`` for instance.
+
+        Args:
+            collection (str): Landsat collection to query (see ``search``)
+            bbox (tuple): A bounding box in the form of a tuple (left, bottom,
+                right, top)
+            begin (datetime.datetime): Optional begin date
+            end (datetime.datetime): Optional end date
+            max_cloud_cover (int): Cloud cover threshold to use for the query
+            months (list): List of month indices (1,12) for only limiting the query
+                to these months
+            starting_number (int): See ``search``
+            max_results (int): Maximum number of scenes to return
+            chunk_size (int): Size in bytes of the chunks read from the
+                response
+
+        Example:
+            >>> from lsru import Usgs
+            >>> from lsru.catalog import write_catalog
+            >>> usgs = Usgs()
+            >>> usgs.login()
+            >>> scenes = usgs.iter_search(collection='LANDSAT_8_C1',
+            ...                           bbox=(-10, 35, 30, 60))
+            >>> write_catalog(scenes, '/path/to/europe.lsru')
+
+        Returns:
+            generator: Generator of scenes metadata
+        """
+        params = self._search_params(collection, bbox, begin, end,
+                                     max_cloud_cover, months, starting_number,
+                                     max_results)
+        import requests
+        r = requests.post('/'.join([self.endpoint, 'search']),
+                          data={'jsonRequest': json.dumps(params)},
+                          stream=True)
+        # Beginning of the response, kept to report api errors
+        head = []
+        def chunks():
+            size = 0
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                if size < 65536:
+                    head.append(chunk)
+                    size += len(chunk)
+                yield chunk
+        with closing(r):
+            n = 0
+            for scene in iter_json_array(chunks(), 'results'):
+                n += 1
+                yield scene
+            # An error response does not contain any results array
+            if n == 0:
+                try:
+                    meta = json.loads(b''.join(head).decode('utf-8'))
+                except ValueError:
+                    return
+                if meta.get('errorCode') is not None:
+                    raise ValueError('%s: %s' % (meta['errorCode'],
+                                                 meta.get('error')))
+
+    def _search_params(self, collection, bbox, begin, end, max_cloud_cover,
+                       months, starting_number, max_results):
+        """Build the json request of a search query"""
         if self.key_age > datetime.timedelta(0, 3600):
             raise ValueError('Api key has probably expired (1 hr), re-run the login method')
-        search_endpoint = '/'.join([self.endpoint, 'search'])
         params = {'apiKey': self.key,
                   'node': 'EE',
                   'datasetName': collection,
@@ -146,9 +230,83 @@ class Usgs(object):
             params.update(endDate=end.isoformat())
         if months is not None:
             params.update(months=months)
-        r = requests.post(search_endpoint,
-                          data={'jsonRequest': json.dumps(params)})
-        return r.json()['data']['results']
+        return params
+
+    def search_many(self, collection, aoi_list, begin=None, end=None,
+                    max_cloud_cover=100, months=None, max_size=2.0,
+                    max_workers=4):
+        """Perform a spatio temporal query for many areas of interest at once
+
+        Bounding boxes of the areas of interest are first grouped into a reduced
+        set of merged query windows (see ``lsru.spatial.cluster_bounds``),
+        which are queried concurrently. Each returned scene is then assigned to
+        the areas of interest its footprint intersects with, using a spatial
+        index of the areas of interest bounding boxes followed by an exact
+        intersection test.
+
+        Args:
+            collection (str): Landsat collection to query (see ``search``)
+            aoi_list (list): List of areas of interest, either bounding boxes in
+                the form of (left, bottom, right, top) tuples or geojson like
+                Polygon or MultiPolygon geometries
+            begin (datetime.datetime): Optional begin date
+            end (datetime.datetime): Optional end date
+            max_cloud_cover (int): Cloud cover threshold to use for the queries
+            months (list): List of month indices (1,12) for only limiting the
+                queries to these months
+            max_size (float): Maximum width and height, in decimal degrees, of
+                a merged query window
+            max_workers (int): Maximum number of queries sent concurrently
+
+        Example:
+            >>> from lsru import Usgs
+            >>> import datetime
+            >>> usgs = Usgs()
+            >>> usgs.login()
+            >>> results = usgs.search_many(collection='LANDSAT_8_C1',
+            ...                            aoi_list=[(3.5, 43.4, 4, 44),
+            ...                                      (4.1, 43.5, 4.3, 43.7)],
+            ...                            begin=datetime.datetime(2012,1,1),
+            ...                            end=datetime.datetime(2016,1,1))
+            >>> print([len(x) for x in results])
+
+        Returns:
+            list: List of lists of scenes metadata, one list per element of
+            ``aoi_list`` and in the same order. Scenes intersecting with several
+            areas of interest are the same objects in each list
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        geom_list = []
+        for aoi in aoi_list:
+            if isinstance(aoi, dict):
+                geom_list.append(aoi)
+            else:
+                left, bottom, right, top = aoi
+                geom_list.append({'type': 'Polygon',
+                                  'coordinates': [[[left, bottom], [left, top],
+                                                   [right, top], [right, bottom],
+                                                   [left, bottom]]]})
+        bbox_list = [bounds(x) for x in geom_list]
+        clusters = cluster_bounds(bbox_list, max_size=max_size)
+        def query(bbox):
+            return self.search(collection=collection, bbox=bbox, begin=begin,
+                               end=end, max_cloud_cover=max_cloud_cover,
+                               months=months)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            responses = list(executor.map(query, [x[0] for x in clusters]))
+        # Neighbouring windows may return the same scenes
+        scenes = {}
+        for scene_list in responses:
+            for scene in scene_list:
+                scenes.setdefault(scene['displayId'], scene)
+        tree = STRtree(bbox_list)
+        results = [[] for _ in aoi_list]
+        for scene in scenes.values():
+            footprint = geom_from_metadata(scene)
+            for idx in tree.query(bounds(footprint)):
+                if intersects(footprint, geom_list[idx]):
+                    results[idx].append(scene)
+        return results
 
 
 class _EspaBase(object):
@@ -188,6 +346,7 @@ class _EspaBase(object):
             verb (str): Request verb (get, post, put ...)
             body (dict): Data to pass to the request
         """
+        import requests
         auth_tup = (self.USER, self.PASSWORD)
         response = getattr(requests, verb)('/'.join([self.host,  endpoint]),
                                            auth=auth_tup, json=body)
@@ -195,7 +354,8 @@ class _EspaBase(object):
         if isinstance(data, dict):
             messages = data.pop("messages", None)
             if messages:
-                pprint(messages)
+                # Keep stdout clean for data (e.g. command line json lines)
+                pprint(messages, stream=sys.stderr)
         response.raise_for_status()
         return data
 
@@ -421,6 +581,16 @@ class Order(_EspaBase):
         """
         return True if self.status == 'complete' else False
 
+    @property
+    def product_opts(self):
+        """Get the processing options of the order
+
+        Return:
+            dict: Products ordered for each sensor and processing options
+            (format, projection, extent, resizing, etc)
+        """
+        return self._request('order/%s' % self.orderid)['product_opts']
+
     @property
     def items_status(self):
         return self._request('item-status/%s' % self.orderid)[self.orderid]
@@ -450,7 +620,9 @@ class Order(_EspaBase):
         return self._request('order', verb='put', body=cancel_request)
 
     def download_all_complete(self, path, unpack=False, overwrite=False,
-                              check_complete=True):
+                              check_complete=True, shard=None, claim=False,
+                              stale_after=600, store=None, stack=None,
+                              stack_dtype=None):
         """Download all completed scenes of the order to a folder
 
         Args:
@@ -466,21 +638,116 @@ class Order(_EspaBase):
                 that you'll save time setting this argument to ``False`` in case
                 you're sure previous downloads are complete
                 Note that this option does not work when ``unpack`` is set to True
+            shard (tuple): Optional (index, count) tuple. When set, only the
+                archives belonging to shard ``index`` out of ``count`` are
+                downloaded. Archives are assigned to shards deterministically
+                based on their name, so that ``count`` machines each running
+                a different shard download every archive exactly once
+            claim (bool): Coordinate with other processes downloading the same
+                order to the same (shared) directory? Each archive is claimed
+                with a lock file before being downloaded and marked as done
+                afterwards, so that it is fetched only once. Archives claimed
+                by other processes are checked again periodically until they
+                are done, and claims of crashed processes are taken over once
+                stale. Defaults to ``False``
+            stale_after (float): Age in seconds after which an archive claim
+                that is not refreshed anymore is considered stale. Only used
+                when ``claim`` is ``True``
+            store (lsru.store.ProductStore): Optional local product store.
+                When set, products already held by the store (e.g. because
+                the same scenes and products were part of a previous order)
+                are hardlinked from the store instead of being downloaded, and
+                newly downloaded products are added to it
+            stack (list): Optional list of band names to stack into a single
+                memory mappable array file while unpacking (see
+                ``lsru.utils.url_retrieve_and_unpack``). Only used when
+                ``unpack`` is ``True``, and not compatible with ``store``
+            stack_dtype (str): Optional data type of the stack, required when
+                the stacked bands do not all have the same data type
+
+        Example:
+            >>> from lsru import Order
+            >>> order = Order('espa-loic.dutrieux@wur.nl-10212018-102816-245')
+            >>> # On each machine sharing /shared/landsat
+            >>> order.download_all_complete('/shared/landsat', claim=True)
 
         Returns:
             Used for its side effect of batch downloading data, no return
         """
-        for url in self.urls_completed:
-            filename = url.split('/')[-1]
-            try:
-                print('Downloading %s' % filename)
-                if unpack:
-                    url_retrieve_and_unpack(url, path, overwrite=overwrite)
-                else:
-                    dst = os.path.join(path, filename)
-                    url_retrieve(url, dst, overwrite=overwrite,
-                                 check_complete=check_complete)
-            except Exception as e:
-                print('%s skipped. Reason: %s' % (filename, e))
+        options = None
+        if store is not None:
+            if stack:
+                raise ValueError('Band stacking is not supported with a product store')
+            options = self.product_opts
+        pending = []
+        for item in self.items_status:
+            if item['status'] != 'complete':
+                continue
+            filename = item['product_dload_url'].split('/')[-1]
+            if shard is not None and not in_shard(filename, shard):
+                continue
+            pending.append(item)
+        while pending:
+            # Archives claimed by other processes; retried until they are done
+            # or their claim goes stale
+            claimed = []
+            for item in pending:
+                url = item['product_dload_url']
+                filename = url.split('/')[-1]
+                if claim:
+                    done = os.path.join(path, '.%s.done' % filename)
+                    if os.path.exists(done):
+                        continue
+                    lock = FileClaim(os.path.join(path, '.%s.claim' % filename),
+                                     stale_after=stale_after)
+                    if not lock.acquire():
+                        claimed.append(item)
+                        continue
+                    # Another process may have completed the archive and
+                    # released its claim since the first check
+                    if os.path.exists(done):
+                        lock.release()
+                        continue
+                # Content of an unpacked directory or store link left by a
+                # crashed process cannot be trusted
+                success = self._download_item(
+                    item, path, unpack=unpack,
+                    overwrite=overwrite or (claim and (unpack or store is not None)),
+                    check_complete=check_complete, store=store,
+                    options=options, stack=stack, stack_dtype=stack_dtype)
+                if claim:
+                    if success:
+                        open(done, 'w').close()
+                    lock.release()
+            pending = claimed
+            if pending:
+                time.sleep(min(60., stale_after / 4.))
+
+    def _download_item(self, item, path, unpack=False, overwrite=False,
+                       check_complete=True, store=None, options=None,
+                       stack=None, stack_dtype=None):
+        """Download a single completed item (see ``download_all_complete``)
+
+        Return:
+            bool: True if the download succeeded, False otherwise
+        """
+        url = item['product_dload_url']
+        filename = url.split('/')[-1]
+        try:
+            print('Downloading %s' % filename)
+            if store is not None:
+                store.retrieve(url, store.key(item['name'], options), path,
+                               unpack=unpack, overwrite=overwrite)
+            elif unpack:
+                url_retrieve_and_unpack(url, path, overwrite=overwrite,
+                                        stack=stack, stack_dtype=stack_dtype)
+            else:
+                dst = os.path.join(path, filename)
+                url_retrieve(url, dst, overwrite=overwrite,
+                             check_complete=check_complete)
+        except Exception as e:
+            print('%s skipped. Reason: %s' % (filename, e))
+            return False
+        return True
 
 
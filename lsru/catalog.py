@@ -0,0 +1,274 @@
+import sys
+import json
+import mmap
+import struct
+import datetime
+from array import array
+
+MAGIC = b'LSRUCAT1'
+EPOCH = datetime.date(1970, 1, 1)
+CORNERS = ('lowerLeftCoordinate', 'upperLeftCoordinate',
+           'upperRightCoordinate', 'lowerRightCoordinate')
+
+
+def _days(date_string):
+    """Convert an iso formatted date to a number of days since 1970-01-01"""
+    if not date_string:
+        return -2**31
+    d = datetime.datetime.strptime(date_string[:10], '%Y-%m-%d').date()
+    return (d - EPOCH).days
+
+
+def _native(arr):
+    """Arrays are stored little endian in catalog files"""
+    if sys.byteorder == 'big':
+        arr.byteswap()
+    return arr
+
+
+def write_catalog(scene_list, filename, fields=None):
+    """Write scenes metadata to a compact columnar catalog file
+
+    Scene ids, acquisition dates, cloud cover and footprint corners are stored
+    as binary columns, and optional additional metadata fields as json encoded
+    strings. Catalog files are read with ``lsru.catalog.Catalog``, which maps
+    the file in memory instead of parsing it.
+
+    Args:
+        scene_list (iterable): Scenes metadata as returned by ``Usgs.search``.
+            May be a generator, scenes are consumed only once
+        filename (str): Path of the catalog file to write
+        fields (list): Optional list of additional metadata fields to store
+            (e.g. ``['sceneBounds', 'browseUrl']``)
+
+    Example:
+        >>> from lsru import Usgs
+        >>> from lsru.catalog import write_catalog
+        >>> import datetime
+        >>> usgs = Usgs()
+        >>> usgs.login()
+        >>> scene_list = usgs.search(collection='LANDSAT_8_C1',
+        ...                          bbox=(3.5, 43.4, 4, 44),
+        ...                          begin=datetime.datetime(2012,1,1),
+        ...                          end=datetime.datetime(2016,1,1))
+        >>> write_catalog(scene_list, '/path/to/catalog.lsru',
+        ...               fields=['browseUrl'])
+
+    Returns:
+        int: The number of scenes written
+    """
+    fields = list(fields or [])
+    strings = {k: (array('Q', [0]), bytearray())
+               for k in ['displayId', 'entityId'] + fields}
+    dates = array('i')
+    cloud_cover = array('d')
+    footprint = array('d')
+    n = 0
+    for scene in scene_list:
+        for k, (offsets, blob) in strings.items():
+            value = scene.get(k)
+            if k in fields:
+                value = json.dumps(value)
+            elif value is None:
+                value = ''
+            blob.extend(value.encode('utf-8'))
+            offsets.append(len(blob))
+        dates.append(_days(scene.get('acquisitionDate')))
+        cc = scene.get('cloudCover')
+        cloud_cover.append(float('nan') if cc is None else float(cc))
+        for corner in CORNERS:
+            footprint.append(scene[corner]['longitude'])
+            footprint.append(scene[corner]['latitude'])
+        n += 1
+    sections = [('acquisitionDate', 'date', _native(dates).tobytes()),
+                ('cloudCover', 'f8', _native(cloud_cover).tobytes()),
+                ('footprint', 'f8', _native(footprint).tobytes())]
+    for k, (offsets, blob) in strings.items():
+        kind = 'json' if k in fields else 'str'
+        sections.append((k, kind, (_native(offsets).tobytes(), bytes(blob))))
+    columns = []
+    def layout(start):
+        columns[:] = []
+        pos = start
+        for name, kind, data in sections:
+            parts = data if isinstance(data, tuple) else (data,)
+            extents = []
+            for part in parts:
+                pos += -pos % 8
+                extents.append([pos, len(part)])
+                pos += len(part)
+            columns.append({'name': name, 'type': kind, 'extents': extents})
+        return json.dumps({'n': n, 'columns': columns}).encode('utf-8')
+    # Section offsets depend on the header length; reserve enough room for
+    # the offsets digits and pad the header to that size
+    header = layout(0)
+    reserved = len(header) + 24 * sum(len(x['extents']) for x in columns)
+    start = len(MAGIC) + 8 + reserved
+    header = layout(start).ljust(reserved, b' ')
+    with open(filename, 'wb') as dst:
+        dst.write(MAGIC)
+        dst.write(struct.pack('<Q', len(header)))
+        dst.write(header)
+        pos = start
+        for column, (name, kind, data) in zip(columns, sections):
+            parts = data if isinstance(data, tuple) else (data,)
+            for (offset, length), part in zip(column['extents'], parts):
+                dst.write(b'\0' * (offset - pos))
+                dst.write(part)
+                pos = offset + length
+    return n
+
+
+class Catalog(object):
+    """Read only, memory mapped access to a catalog file
+
+    Opening a catalog only parses its small json header; columns are read
+    directly from the memory mapped file when accessed, so that catalogs of
+    millions of scenes open almost instantly.
+
+    Args:
+        filename (str): Path of a catalog file written by
+            ``lsru.catalog.write_catalog``
+
+    Attributes:
+        filename (str): Path of the catalog file
+        columns (list): Names of the columns stored in the catalog
+
+    Example:
+        >>> from lsru.catalog import Catalog
+        >>> from lsru.utils import geom_from_metadata
+        >>> with Catalog('/path/to/catalog.lsru') as catalog:
+        ...     print(len(catalog))
+        ...     clear = [i for i, cc in enumerate(catalog.column('cloudCover'))
+        ...              if cc < 10]
+        ...     print(geom_from_metadata(catalog[clear[0]]))
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as src:
+            self._mmap = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError('%s is not a lsru catalog file' % filename)
+        start = len(MAGIC) + 8
+        header_len = struct.unpack('<Q', self._mmap[len(MAGIC):start])[0]
+        header = json.loads(self._mmap[start:start + header_len].decode('utf-8'))
+        self._n = header['n']
+        self._columns = {x['name']: x for x in header['columns']}
+        self.columns = [x['name'] for x in header['columns']]
+        self._cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self._n
+
+    def close(self):
+        """Release the memory mapped file
+
+        Columns previously obtained with ``column()`` cannot be used anymore
+        once the catalog is closed. When slices of columns are still referenced
+        elsewhere, the file is only unmapped once they are garbage collected
+        """
+        for values in self._cache.values():
+            if isinstance(values, _StringColumn):
+                values = values._offsets
+            if isinstance(values, memoryview):
+                values.release()
+        self._cache = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+    def _numeric(self, offset, length, typecode):
+        view = memoryview(self._mmap)[offset:offset + length]
+        if sys.byteorder == 'big':
+            return _native(array(typecode, view.tobytes()))
+        return view.cast(typecode)
+
+    def column(self, name):
+        """Access a column of the catalog
+
+        Args:
+            name (str): Column name (see ``columns`` attribute)
+
+        Returns:
+            sequence: A memoryview of doubles for ``cloudCover`` and
+            ``footprint`` (8 values per scene, longitude and latitude of the
+            lower left, upper left, upper right and lower right corners), a
+            memoryview of integers (days since 1970-01-01) for
+            ``acquisitionDate``, and a lazy sequence of decoded values for
+            string and additional metadata columns
+        """
+        if name not in self._cache:
+            column = self._columns[name]
+            kind = column['type']
+            if kind == 'f8':
+                self._cache[name] = self._numeric(*column['extents'][0],
+                                                  typecode='d')
+            elif kind == 'date':
+                self._cache[name] = self._numeric(*column['extents'][0],
+                                                  typecode='i')
+            else:
+                offsets = self._numeric(*column['extents'][0], typecode='Q')
+                self._cache[name] = _StringColumn(self._mmap, offsets,
+                                                  column['extents'][1][0],
+                                                  kind == 'json')
+        return self._cache[name]
+
+    def __getitem__(self, i):
+        """Rebuild a (partial) scene metadata dictionary
+
+        Records have the same structure as the metadata returned by
+        ``Usgs.search``, so that they can be used with functions such as
+        ``lsru.utils.geom_from_metadata``
+        """
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError('catalog index out of range')
+        record = {}
+        for name in self.columns:
+            values = self.column(name)
+            if name == 'acquisitionDate':
+                days = values[i]
+                record[name] = (None if days == -2**31 else
+                                (EPOCH + datetime.timedelta(days=days)).isoformat())
+            elif name == 'footprint':
+                for j, corner in enumerate(CORNERS):
+                    record[corner] = {'longitude': values[i * 8 + 2 * j],
+                                      'latitude': values[i * 8 + 2 * j + 1]}
+            else:
+                record[name] = values[i]
+        return record
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self[i]
+
+
+class _StringColumn(object):
+    """Lazy sequence of strings stored as an offsets array and an utf-8 blob"""
+    def __init__(self, buf, offsets, start, is_json):
+        self._buf = buf
+        self._offsets = offsets
+        self._start = start
+        self._is_json = is_json
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('column index out of range')
+        begin = self._start + self._offsets[i]
+        end = self._start + self._offsets[i + 1]
+        value = self._buf[begin:end].decode('utf-8')
+        return json.loads(value) if self._is_json else value
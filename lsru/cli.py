@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import argparse
+
+
+def _read_ids(values, key):
+    """Identifiers from the command line or from json lines on stdin"""
+    if values:
+        for value in values:
+            yield value
+        return
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('{'):
+            yield json.loads(line)[key]
+        else:
+            yield line
+
+
+def _emit(record):
+    sys.stdout.write(json.dumps(record) + '\n')
+    sys.stdout.flush()
+
+
+def _date(value):
+    import datetime
+    return datetime.datetime.strptime(value, '%Y-%m-%d')
+
+
+def search(args):
+    from lsru import Usgs
+    usgs = Usgs(conf=args.conf)
+    if not usgs.login():
+        raise SystemExit('Usgs login failed')
+    scenes = usgs.iter_search(collection=args.collection, bbox=args.bbox,
+                              begin=args.begin, end=args.end,
+                              max_cloud_cover=args.max_cloud_cover,
+                              months=args.months,
+                              max_results=args.max_results)
+    for scene in scenes:
+        if args.fields:
+            scene = {k: scene.get(k) for k in args.fields}
+        _emit(scene)
+
+
+def order(args):
+    from lsru import Espa
+    espa = Espa(conf=args.conf)
+    scene_list = list(_read_ids(args.scene_ids, 'displayId'))
+    if not scene_list:
+        return
+    o = espa.order(scene_list, products=args.products, format=args.format,
+                   note=args.note, resolution=args.resolution)
+    _emit({'orderid': o.orderid})
+
+
+def status(args):
+    import time
+    from lsru import Order
+    for orderid in _read_ids(args.orderids, 'orderid'):
+        o = Order(orderid, conf=args.conf)
+        order_status = o.status
+        while args.wait and order_status not in ('complete', 'purged',
+                                                 'cancelled'):
+            time.sleep(args.interval)
+            order_status = o.status
+        _emit({'orderid': orderid, 'status': order_status})
+
+
+def download(args):
+    from contextlib import redirect_stdout
+    from lsru import Order
+    shard = None
+    if args.shard is not None:
+        shard = tuple(int(x) for x in args.shard.split('/'))
+    for orderid in _read_ids(args.orderids, 'orderid'):
+        o = Order(orderid, conf=args.conf)
+        # Keep stdout for json lines
+        with redirect_stdout(sys.stderr):
+            o.download_all_complete(args.path, unpack=args.unpack,
+                                    overwrite=args.overwrite, shard=shard,
+                                    claim=args.claim)
+        _emit({'orderid': orderid, 'path': args.path})
+
+
+def main(argv=None):
+    """Entry point of the ``lsru`` command"""
+    parser = argparse.ArgumentParser(
+        prog='lsru',
+        description='Query, order and download Landsat surface reflectance data')
+    parser.add_argument('--conf', default=os.path.expanduser('~/.lsru'),
+                        help='Configuration file containing usgs credentials')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('search', help='Query the Landsat catalog')
+    p.add_argument('--collection', required=True,
+                   help='Landsat collection, e.g. LANDSAT_8_C1')
+    p.add_argument('--bbox', required=True, nargs=4, type=float,
+                   metavar=('LEFT', 'BOTTOM', 'RIGHT', 'TOP'))
+    p.add_argument('--begin', type=_date, help='Begin date (YYYY-MM-DD)')
+    p.add_argument('--end', type=_date, help='End date (YYYY-MM-DD)')
+    p.add_argument('--max-cloud-cover', type=int, default=100)
+    p.add_argument('--months', type=int, nargs='+')
+    p.add_argument('--max-results', type=int, default=50000)
+    p.add_argument('--fields', nargs='+',
+                   help='Only output these metadata fields')
+    p.set_defaults(func=search)
+
+    p = subparsers.add_parser('order', help='Place an espa order')
+    p.add_argument('scene_ids', nargs='*',
+                   help='Scene ids. Read from stdin when omitted')
+    p.add_argument('--products', required=True, nargs='+')
+    p.add_argument('--format', default='gtiff')
+    p.add_argument('--note')
+    p.add_argument('--resolution', type=float)
+    p.set_defaults(func=order)
+
+    p = subparsers.add_parser('status', help='Get the status of espa orders')
+    p.add_argument('orderids', nargs='*',
+                   help='Order ids. Read from stdin when omitted')
+    p.add_argument('--wait', action='store_true',
+                   help='Wait for the orders to be complete')
+    p.add_argument('--interval', type=float, default=300,
+                   help='Polling interval in seconds when waiting')
+    p.set_defaults(func=status)
+
+    p = subparsers.add_parser('download',
+                              help='Download completed items of espa orders')
+    p.add_argument('path', help='Download directory')
+    p.add_argument('orderids', nargs='*',
+                   help='Order ids. Read from stdin when omitted')
+    p.add_argument('--unpack', action='store_true')
+    p.add_argument('--overwrite', action='store_true')
+    p.add_argument('--shard', help='Only download shard INDEX/COUNT')
+    p.add_argument('--claim', action='store_true',
+                   help='Coordinate with other processes through lock files')
+    p.set_defaults(func=download)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import io
+import zlib
+import importlib
+from collections import OrderedDict
+
+# Decompression backends, in order of preference. Values are the names of
+# modules exposing a zlib compatible ``decompressobj`` function
+_BACKENDS = OrderedDict([('isal', 'isal.isal_zlib'),
+                         ('zlib_ng', 'zlib_ng.zlib_ng'),
+                         ('zlib', 'zlib')])
+
+
+def register_decompressor(name, module, first=True):
+    """Register a zlib compatible decompression backend
+
+    Args:
+        name (str): Name of the backend
+        module (str or module): Module (or module name) exposing a
+            ``decompressobj(wbits)`` function with the same interface as the
+            one of the standard library ``zlib`` module
+        first (bool): Give the backend precedence over the already registered
+            ones when selecting the default backend? Defaults to True
+    """
+    _BACKENDS[name] = module
+    if first:
+        _BACKENDS.move_to_end(name, last=False)
+
+
+def available_decompressors():
+    """List the registered decompression backends that can be imported
+
+    Returns:
+        list: Backend names, in order of preference
+    """
+    out = []
+    for name in _BACKENDS:
+        try:
+            _module(name)
+        except ImportError:
+            continue
+        out.append(name)
+    return out
+
+
+def _module(name):
+    module = _BACKENDS[name]
+    if isinstance(module, str):
+        module = importlib.import_module(module)
+        _BACKENDS[name] = module
+    return module
+
+
+def get_decompressor(name=None):
+    """Get a gzip stream decompressor factory
+
+    Args:
+        name (str): Name of the backend to use. Defaults to the first
+            available backend in order of preference (``isal`` and ``zlib_ng``
+            when installed, standard library ``zlib`` otherwise)
+
+    Returns:
+        callable: Function returning a new decompression object with
+        ``decompress(data)`` and ``flush()`` methods
+    """
+    if name is None:
+        name = available_decompressors()[0]
+    module = _module(name)
+    return lambda: module.decompressobj(16 + zlib.MAX_WBITS)
+
+
+class DecompressingReader(io.RawIOBase):
+    """Readable file object decompressing a stream of gzip data chunks
+
+    Concatenated and zero padded gzip members are supported; ``EOFError`` is
+    raised when the stream ends within a member. Data not starting with the
+    gzip magic number are passed through unchanged
+
+    Args:
+        chunks (iterable): Iterable of compressed bytes chunks
+        decompressor (str): Name of the decompression backend (see
+            ``get_decompressor``)
+        max_output (int): Maximum size in bytes of the data decompressed at
+            once. Bounds memory usage on highly compressible input
+    """
+    def __init__(self, chunks, decompressor=None, max_output=1024 * 1024):
+        self._chunks = iter(chunks)
+        self._factory = get_decompressor(decompressor)
+        self._max_output = max_output
+        self._obj = None
+        self._passthrough = None
+        self._pending = b''
+        self._full = False
+        self._buf = b''
+        self._pos = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        for chunk in self._chunks:
+            if chunk:
+                return chunk
+        return None
+
+    def _fill(self):
+        while True:
+            # Decompressor output is bounded; input left over by a call is
+            # kept for the next one. A full output may also leave data
+            # buffered in the decompressor, hence another call before reading
+            # more input
+            if not self._pending and not self._full:
+                chunk = self._next_chunk()
+                if chunk is None:
+                    break
+                if self._passthrough is None:
+                    self._passthrough = chunk[:2] != b'\x1f\x8b'
+                if self._passthrough:
+                    return chunk
+                self._pending = chunk
+            if self._obj is None:
+                # Like the gzip module, ignore zero padding between and
+                # after members
+                self._pending = self._pending.lstrip(b'\0')
+                if not self._pending:
+                    continue
+                self._obj = self._factory()
+            data = self._obj.decompress(self._pending, self._max_output)
+            self._full = len(data) == self._max_output
+            if self._obj.eof:
+                self._pending = self._obj.unused_data
+                self._obj = None
+                self._full = False
+            else:
+                self._pending = self._obj.unconsumed_tail
+            if data:
+                return data
+        self._eof = True
+        if self._obj is not None:
+            raise EOFError('Compressed file ended before the end-of-stream '
+                           'marker was reached')
+        return b''
+
+    def readinto(self, b):
+        while self._pos == len(self._buf) and not self._eof:
+            self._buf = memoryview(self._fill())
+            self._pos = 0
+        n = min(len(b), len(self._buf) - self._pos)
+        b[:n] = self._buf[self._pos:self._pos + n]
+        self._pos += n
+        return n
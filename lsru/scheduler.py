@@ -0,0 +1,282 @@
+import os
+import re
+import time
+import heapq
+import shutil
+import threading
+import itertools
+
+from .utils import url_retrieve, url_retrieve_and_unpack
+
+
+def most_recent_first(url):
+    """Default download priority: most recent acquisitions first
+
+    Acquisition date is parsed from the espa archive name (e.g.
+    ``LC080330532018012601T1-SC20181022102816.tar.gz``)
+
+    Args:
+        url (str): Archive download url
+
+    Returns:
+        int: Priority, lower values are downloaded first
+    """
+    m = re.match(r'L[COTE]0\d\d{6}(\d{8})', url.split('/')[-1])
+    return -int(m.group(1)) if m is not None else 0
+
+
+class Throttle(object):
+    """Shared transfer rate limiter and pause switch
+
+    Instances are passed as ``throttle`` argument to ``url_retrieve`` and
+    ``url_retrieve_and_unpack``; all transfers sharing an instance are jointly
+    limited to ``max_rate`` and block while the throttle is paused.
+
+    Args:
+        max_rate (float): Maximum transfer rate in bytes per second. ``None``
+            (default) means no limit
+    """
+    def __init__(self, max_rate=None):
+        self.max_rate = max_rate
+        self._lock = threading.Lock()
+        self._next = time.time()
+        self._running = threading.Event()
+        self._running.set()
+
+    def pause(self):
+        """Block all transfers after their current chunk"""
+        self._running.clear()
+
+    def resume(self):
+        """Resume paused transfers"""
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def __call__(self, nbytes):
+        self._running.wait()
+        if self.max_rate is None:
+            return
+        # Reserve a transfer slot and wait until it starts
+        with self._lock:
+            now = time.time()
+            start = max(self._next, now)
+            self._next = start + nbytes / float(self.max_rate)
+        if start > now:
+            time.sleep(start - now)
+
+
+class DownloadScheduler(object):
+    """Prioritized, bandwidth and disk space aware downloader of espa orders
+
+    Completed items of one or several orders are queued with a priority and
+    downloaded by a pool of workers. A job only starts when the free space
+    of the target volume, minus the space reserved by running jobs and a safety
+    margin, can accommodate the expected size of the archive (``Content-Length``);
+    it waits for running jobs to complete otherwise, and is only deferred when
+    it does not fit even once they are all done.
+    Jobs whose output is already present and complete are admitted regardless
+    of disk space, unless ``overwrite`` is set.
+    All transfers share a global bandwidth cap and can be paused and resumed.
+
+    Args:
+        path (str): Directory where data are to be downloaded
+        max_rate (float): Global bandwidth cap in bytes per second. Defaults to
+            ``None`` (no cap)
+        reserve (int): Disk space in bytes that must remain free on the target
+            volume. Defaults to 0
+        workers (int): Number of concurrent transfers. Defaults to 2
+        unpack (bool): Unpack downloaded archives on the fly
+        unpack_ratio (float): Expected ratio between unpacked and archive size,
+            used for disk space admission when ``unpack`` is ``True``
+        overwrite (bool): Force overwriting existing files even when they
+            already exist? Defaults to False
+
+    Attributes:
+        throttle (lsru.scheduler.Throttle): Rate limiter shared by all transfers
+        deferred (list): Jobs that could not be admitted for lack of disk
+            space, even with no other job running
+
+    Example:
+        >>> from lsru import Espa
+        >>> from lsru.scheduler import DownloadScheduler
+        >>> espa = Espa()
+        >>> scheduler = DownloadScheduler('/media/landsat/download/dir',
+        ...                               max_rate=50 * 1024**2,
+        ...                               reserve=10 * 1024**3)
+        >>> for order in espa.orders:
+        ...     if order.is_complete:
+        ...         scheduler.add(order)
+        >>> scheduler.run()
+    """
+    def __init__(self, path, max_rate=None, reserve=0, workers=2,
+                 unpack=False, unpack_ratio=3., overwrite=False):
+        self.path = path
+        self.reserve = reserve
+        self.workers = workers
+        self.unpack = unpack
+        self.unpack_ratio = unpack_ratio
+        self.overwrite = overwrite
+        self.throttle = Throttle(max_rate)
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._reserved = 0
+        self._stopped = False
+        self.deferred = []
+
+    def add(self, order, priority=most_recent_first):
+        """Queue all completed items of an order
+
+        Args:
+            order (lsru.Order): The order to download
+            priority (callable): Function computing the priority of a job from
+                its download url; jobs with lower values are downloaded first.
+                Defaults to most recent acquisitions first
+
+        Returns:
+            int: Number of jobs queued
+        """
+        url_list = order.urls_completed
+        with self._cond:
+            for url in url_list:
+                heapq.heappush(self._queue,
+                               (priority(url), next(self._counter), url))
+            self._cond.notify_all()
+        return len(url_list)
+
+    def __len__(self):
+        return len(self._queue)
+
+    def pause(self):
+        """Pause running transfers and prevent new jobs from starting"""
+        self.throttle.pause()
+
+    def resume(self):
+        """Resume paused transfers and jobs"""
+        self.throttle.resume()
+        with self._cond:
+            self._cond.notify_all()
+
+    def stop(self):
+        """Let running transfers complete, then make ``run()`` return
+
+        Jobs not yet started remain queued and are processed by the next call
+        to ``run()``
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self.throttle.resume()
+
+    def _required_space(self, url):
+        """Expected disk usage of a job; 0 when its output is already complete"""
+        filename = url.split('/')[-1]
+        if self.unpack and not self.overwrite:
+            # Existing directories are not downloaded again by url_retrieve_and_unpack
+            if os.path.isdir(os.path.join(self.path, filename.split('.')[0])):
+                return 0
+        import requests
+        r = requests.head(url, allow_redirects=True)
+        size = int(r.headers.get('Content-Length', 0))
+        if self.unpack:
+            return int(size * self.unpack_ratio)
+        filename = os.path.join(self.path, filename)
+        if (not self.overwrite and os.path.isfile(filename)
+                and os.path.getsize(filename) == size):
+            return 0
+        return size
+
+    def _next_job(self):
+        """Pop the next job that can be admitted; None when there is nothing left"""
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped or not self._queue:
+                        return None
+                    if not self.throttle.paused:
+                        break
+                    self._cond.wait(1)
+                job = heapq.heappop(self._queue)
+            filename = job[2].split('/')[-1]
+            # Size query happens outside of the lock
+            try:
+                size = self._required_space(job[2])
+            except Exception as e:
+                print('%s skipped. Reason: %s' % (filename, e))
+                self._done(0)
+                continue
+            with self._cond:
+                while True:
+                    # Running jobs keep their full reservation until completion,
+                    # which is conservative since part of it is already on disk
+                    free = shutil.disk_usage(self.path).free - self.reserve - self._reserved
+                    if size == 0 or size <= free:
+                        self._reserved += size
+                        return job, size
+                    if self._stopped:
+                        heapq.heappush(self._queue, job)
+                        return None
+                    if not self._reserved:
+                        break
+                    # Wait for running jobs to release their reservation
+                    self._cond.wait(1)
+                self.deferred.append(job)
+            print('%s deferred. Reason: not enough disk space (%d bytes required)'
+                  % (filename, size))
+            self._done(0)
+
+    def _done(self, size):
+        with self._cond:
+            self._reserved -= size
+            self._cond.notify_all()
+
+    def _worker(self, results):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            (priority, _, url), size = job
+            filename = url.split('/')[-1]
+            try:
+                print('Downloading %s' % filename)
+                if self.unpack:
+                    out = url_retrieve_and_unpack(url, self.path,
+                                                  overwrite=self.overwrite,
+                                                  throttle=self.throttle)
+                else:
+                    out = url_retrieve(url, os.path.join(self.path, filename),
+                                       overwrite=self.overwrite,
+                                       throttle=self.throttle)
+                results.append(out)
+            except Exception as e:
+                print('%s skipped. Reason: %s' % (filename, e))
+            finally:
+                self._done(size)
+
+    def run(self):
+        """Process queued jobs until the queue is empty or ``stop()`` is called
+
+        Blocks until completion; call from a separate thread to ``pause()``,
+        ``resume()`` or ``stop()`` the scheduler from the calling program.
+        Jobs that could not be admitted for lack of disk space are kept in the
+        ``deferred`` attribute and queued again by the next call to ``run()``
+
+        Returns:
+            list: Paths of the downloaded files (or unpacked directories)
+        """
+        with self._cond:
+            self._stopped = False
+            for job in self.deferred:
+                heapq.heappush(self._queue, job)
+            self.deferred = []
+        results = []
+        threads = [threading.Thread(target=self._worker, args=(results,))
+                   for _ in range(self.workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
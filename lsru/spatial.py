@@ -0,0 +1,201 @@
+import math
+
+from .utils import bounds
+
+
+def _union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _bbox_intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+class STRtree(object):
+    """Static R-tree of bounding boxes, bulk loaded with the Sort-Tile-Recursive algorithm
+
+    Args:
+        bbox_list (list): List of bounding boxes in the form of (left, bottom,
+            right, top) tuples
+        node_capacity (int): Maximum number of children of each node
+
+    Example:
+        >>> from lsru.spatial import STRtree
+        >>> tree = STRtree([(0, 0, 1, 1), (2, 2, 3, 3), (0.5, 0.5, 2.5, 2.5)])
+        >>> print(sorted(tree.query((0.8, 0.8, 1.2, 1.2))))
+        [0, 2]
+    """
+    def __init__(self, bbox_list, node_capacity=10):
+        self.node_capacity = node_capacity
+        # Leaves are (bbox, index) tuples, nodes are (bbox, [children]) tuples
+        level = [(tuple(bbox), i) for i, bbox in enumerate(bbox_list)]
+        self._leaf = True
+        while len(level) > node_capacity:
+            level = self._pack(level)
+            self._leaf = False
+        self._root = level
+
+    def _pack(self, items):
+        """Group a list of entries into parent nodes"""
+        n_nodes = int(math.ceil(len(items) / float(self.node_capacity)))
+        n_slices = int(math.ceil(math.sqrt(n_nodes)))
+        slice_size = n_slices * self.node_capacity
+        items = sorted(items, key=lambda x: x[0][0] + x[0][2])
+        nodes = []
+        for i in range(0, len(items), slice_size):
+            vertical_slice = sorted(items[i:i + slice_size],
+                                    key=lambda x: x[0][1] + x[0][3])
+            for j in range(0, len(vertical_slice), self.node_capacity):
+                children = vertical_slice[j:j + self.node_capacity]
+                bbox = children[0][0]
+                for child in children[1:]:
+                    bbox = _union(bbox, child[0])
+                nodes.append((bbox, children))
+        return nodes
+
+    def query(self, bbox):
+        """Find the entries whose bounding box intersects with a bounding box
+
+        Args:
+            bbox (tuple): Bounding box in the form of a (left, bottom, right,
+                top) tuple
+
+        Returns:
+            list: Indices (positions in the list used to build the tree) of the
+            intersecting entries
+        """
+        out = []
+        stack = [(self._root, self._leaf)]
+        while stack:
+            entries, is_leaf = stack.pop()
+            for entry_bbox, child in entries:
+                if not _bbox_intersects(entry_bbox, bbox):
+                    continue
+                if is_leaf:
+                    out.append(child)
+                else:
+                    stack.append((child, isinstance(child[0][1], int)))
+        return out
+
+
+def cluster_bounds(bbox_list, max_size=2.0):
+    """Group bounding boxes into a reduced set of merged query windows
+
+    Boxes are greedily added to a nearby cluster as long as the width and
+    height of the merged window do not exceed ``max_size``. Since Landsat
+    scenes cover approximately 185 km, a query on a window of a couple of
+    degrees returns few scenes that would not have been returned by the
+    queries of the individual boxes it contains.
+
+    Args:
+        bbox_list (list): List of bounding boxes in the form of (left, bottom,
+            right, top) tuples
+        max_size (float): Maximum width and height of a merged window, in
+            decimal degrees. Boxes larger than that are never merged
+
+    Example:
+        >>> from lsru.spatial import cluster_bounds
+        >>> print(cluster_bounds([(3.5, 43.4, 4, 44), (4.1, 43.5, 4.3, 43.7),
+        ...                       (-110.5, 24, -110, 24.5)]))
+        [((-110.5, 24, -110, 24.5), [2]), ((3.5, 43.4, 4.3, 44), [0, 1])]
+
+    Returns:
+        list: List of (bbox, indices) tuples, one per cluster, where indices
+        are the positions in ``bbox_list`` of the boxes grouped in the cluster
+    """
+    clusters = []
+    # Clusters are registered in a regular grid according to the center of
+    # their seed, so that candidates only need to be searched for in the
+    # neighbouring cells
+    grid = {}
+    def cell(bbox):
+        return (int(math.floor((bbox[0] + bbox[2]) / 2.0 / max_size)),
+                int(math.floor((bbox[1] + bbox[3]) / 2.0 / max_size)))
+    order = sorted(range(len(bbox_list)), key=lambda i: bbox_list[i][0])
+    for i in order:
+        bbox = tuple(bbox_list[i])
+        cx, cy = cell(bbox)
+        candidates = [c for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                      for c in grid.get((cx + dx, cy + dy), [])]
+        for c in sorted(candidates):
+            merged = _union(clusters[c][0], bbox)
+            if merged[2] - merged[0] <= max_size and merged[3] - merged[1] <= max_size:
+                clusters[c][0] = merged
+                clusters[c][1].append(i)
+                break
+        else:
+            grid.setdefault((cx, cy), []).append(len(clusters))
+            clusters.append([bbox, [i]])
+    return [(bbox, sorted(idx)) for bbox, idx in clusters]
+
+
+def _rings(geom):
+    """List the linear rings of a geojson like Polygon or MultiPolygon"""
+    if geom['type'] == 'Polygon':
+        return [geom['coordinates']]
+    if geom['type'] == 'MultiPolygon':
+        return geom['coordinates']
+    raise ValueError('Unsupported geometry type: %s' % geom['type'])
+
+
+def _segments_intersect(p1, p2, p3, p4):
+    def orientation(a, b, c):
+        v = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+        return (v > 0) - (v < 0)
+    def on_segment(a, b, c):
+        return (min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and
+                min(a[1], b[1]) <= c[1] <= max(a[1], b[1]))
+    o1 = orientation(p1, p2, p3)
+    o2 = orientation(p1, p2, p4)
+    o3 = orientation(p3, p4, p1)
+    o4 = orientation(p3, p4, p2)
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and on_segment(p1, p2, p3)) or
+            (o2 == 0 and on_segment(p1, p2, p4)) or
+            (o3 == 0 and on_segment(p3, p4, p1)) or
+            (o4 == 0 and on_segment(p3, p4, p2)))
+
+
+def _point_in_polygon(point, polygon):
+    """Even-odd rule test of a point against a polygon (list of rings)"""
+    x, y = point[:2]
+    inside = False
+    for ring in polygon:
+        for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+            if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                inside = not inside
+    return inside
+
+
+def intersects(geom1, geom2):
+    """Test whether two geojson like polygons intersect
+
+    Pure python equivalent of ``shape(geom1).intersects(shape(geom2))`` for
+    Polygon and MultiPolygon geometries expressed in the same coordinate
+    reference system
+
+    Args:
+        geom1 (dict): Geojson like geometry
+        geom2 (dict): Geojson like geometry
+
+    Returns:
+        bool
+    """
+    if not _bbox_intersects(bounds(geom1), bounds(geom2)):
+        return False
+    polygons1 = _rings(geom1)
+    polygons2 = _rings(geom2)
+    for poly1 in polygons1:
+        for poly2 in polygons2:
+            for ring1 in poly1:
+                for ring2 in poly2:
+                    for p1, p2 in zip(ring1, ring1[1:]):
+                        for p3, p4 in zip(ring2, ring2[1:]):
+                            if _segments_intersect(p1, p2, p3, p4):
+                                return True
+            # No crossing boundaries, one polygon may contain the other
+            if (_point_in_polygon(poly1[0][0], poly2) or
+                    _point_in_polygon(poly2[0][0], poly1)):
+                return True
+    return False
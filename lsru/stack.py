@@ -0,0 +1,116 @@
+import os
+import json
+
+
+def _band_name(member_name, bands):
+    """Return the band a tar member corresponds to, or None"""
+    base, ext = os.path.splitext(os.path.basename(member_name))
+    if ext.lower() not in ('.tif', '.tiff'):
+        return None
+    matches = [band for band in bands
+               if base.endswith('_%s' % band) or base == band]
+    if len(matches) > 1:
+        raise ValueError('%s matches several bands: %s'
+                         % (member_name, ', '.join(matches)))
+    return matches[0] if matches else None
+
+
+def stack_archive(archive, path, name, bands, dtype=None):
+    """Extract a tar archive, stacking selected bands into a single array file
+
+    Members of the archive are processed in order, which makes the function
+    usable on archives opened in streaming mode (``tarfile.open(mode='r|*')``).
+    Selected bands are decoded in memory and written directly to a band
+    sequential ``.npy`` file that can later be memory mapped; all other members
+    are extracted as usual. Requires ``numpy`` and ``rasterio``.
+
+    Args:
+        archive (tarfile.TarFile): Opened espa archive (GeoTIFF format)
+        path (str): Directory to which the archive is extracted
+        name (str): Base name of the stack files (``<name>_stack.npy`` and
+            ``<name>_stack.json``)
+        bands (list): Names of the bands to stack, in order, as found at the
+            end of the espa file names (e.g. ``['sr_band4', 'sr_band5',
+            'pixel_qa']``). Each name must match a single member of the
+            archive
+        dtype (str or numpy.dtype): Data type of the stack. Bands are only
+            converted when the conversion is safe (e.g. uint8 to int16). When
+            not set, all stacked bands must have the same data type
+
+    Returns:
+        str: Path of the ``.npy`` file
+    """
+    try:
+        import numpy as np
+        from rasterio.io import MemoryFile
+    except ImportError:
+        raise ImportError('numpy and rasterio are required for band stacking; '
+                          'install them with pip install lsru[stack]')
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    filename = os.path.join(path, '%s_stack.npy' % name)
+    stack = None
+    meta = {}
+    found = {}
+    for member in archive:
+        band = _band_name(member.name, bands) if member.isfile() else None
+        if band is None:
+            archive.extract(member, path=path)
+            continue
+        if band in found:
+            raise ValueError('%s matches both %s and %s'
+                             % (band, found[band], member.name))
+        found[band] = member.name
+        with MemoryFile(archive.extractfile(member).read()) as memfile:
+            with memfile.open() as src:
+                if stack is None:
+                    stack = np.lib.format.open_memmap(
+                        filename, mode='w+', dtype=dtype or src.dtypes[0],
+                        shape=(len(bands), src.height, src.width))
+                    meta = {'bands': list(bands),
+                            'crs': src.crs.to_wkt() if src.crs else None,
+                            'transform': list(src.transform)[:6],
+                            'nodata': src.nodata}
+                if (src.height, src.width) != stack.shape[1:]:
+                    raise ValueError('%s does not have the dimensions of the '
+                                     'other stacked bands' % member.name)
+                if dtype is None and np.dtype(src.dtypes[0]) != stack.dtype:
+                    raise ValueError('%s is %s while other stacked bands are %s; '
+                                     'set dtype to stack them together'
+                                     % (member.name, src.dtypes[0], stack.dtype))
+                if not np.can_cast(src.dtypes[0], stack.dtype, 'safe'):
+                    raise ValueError('%s cannot be safely converted from %s to %s'
+                                     % (member.name, src.dtypes[0], stack.dtype))
+                stack[bands.index(band)] = src.read(1)
+    missing = [x for x in bands if x not in found]
+    if missing:
+        raise ValueError('Bands not found in archive: %s' % ', '.join(missing))
+    stack.flush()
+    del stack
+    with open(os.path.join(path, '%s_stack.json' % name), 'w') as dst:
+        json.dump(meta, dst, indent=2)
+    return filename
+
+
+def open_stack(filename):
+    """Memory map a band stack written during archive unpacking
+
+    Args:
+        filename (str): Path of the ``.npy`` stack file
+
+    Example:
+        >>> from lsru.stack import open_stack
+        >>> arr, meta = open_stack('/path/to/LC080330532018012601T1-SC20181022102816'
+        ...                        '/LC080330532018012601T1-SC20181022102816_stack.npy')
+        >>> nir = arr[meta['bands'].index('sr_band5')]
+
+    Returns:
+        tuple: Read only memory mapped array of shape (bands, rows, cols) and
+        dictionary of metadata (band names, crs, affine transform and nodata
+        value)
+    """
+    import numpy as np
+    arr = np.load(filename, mmap_mode='r')
+    with open('%s.json' % os.path.splitext(filename)[0]) as src:
+        meta = json.load(src)
+    return arr, meta
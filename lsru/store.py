@@ -0,0 +1,198 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+
+from .utils import url_retrieve, url_retrieve_and_unpack
+
+
+def _link(src, dst):
+    """Hardlink a file, falling back to a copy across filesystems"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _link_tree(src, dst):
+    """Recreate a directory tree where every file is a hardlink"""
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        if not os.path.isdir(target):
+            os.makedirs(target)
+        for f in files:
+            _link(os.path.join(root, f), os.path.join(target, f))
+
+
+def _du(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+    return size
+
+
+class ProductStore(object):
+    """Local content addressed store of pre-processed Landsat products
+
+    Products are stored under a key derived from the scene id and the
+    processing options of the order (products, format, projection, extent,
+    resizing, resampling). Requesting content already held by the store
+    (e.g. the same scene and products re-ordered in a different espa order)
+    is satisfied by hardlinking the stored files instead of downloading them
+    again. Since stored and linked files share the same data on disk, linked
+    files must not be modified in place.
+
+    Args:
+        root (str): Root directory of the store. Should be on the same
+            filesystem as the download directories for hardlinks to be used;
+            files are copied otherwise
+        max_size (int): Optional maximum size of the store, in bytes. When set,
+            least recently used entries are removed by ``gc()`` after each
+            new entry is added
+
+    Example:
+        >>> from lsru import Espa
+        >>> from lsru.store import ProductStore
+        >>> espa = Espa()
+        >>> store = ProductStore('/media/landsat/store', max_size=500 * 1024**3)
+        >>> for order in espa.orders:
+        ...     if order.is_complete:
+        ...         order.download_all_complete('/media/landsat/download/dir',
+        ...                                     store=store)
+    """
+    def __init__(self, root, max_size=None):
+        self.root = root
+        self.max_size = max_size
+        for d in ('objects', 'tmp'):
+            if not os.path.isdir(os.path.join(root, d)):
+                os.makedirs(os.path.join(root, d))
+
+    @staticmethod
+    def key(scene_id, options):
+        """Compute the store key of a scene processed with given options
+
+        Args:
+            scene_id (str): Landsat scene id
+            options (dict): Product options of the order, as returned by
+                ``Order.product_opts``. The order note and the options of the
+                sensors the scene does not belong to are ignored
+
+        Returns:
+            str: Hexadecimal key
+        """
+        opts = {}
+        for k, v in options.items():
+            if k == 'note':
+                continue
+            if isinstance(v, dict) and 'inputs' in v:
+                if scene_id in v['inputs']:
+                    opts[k] = sorted(v.get('products', []))
+                continue
+            opts[k] = v
+        content = json.dumps({'scene': scene_id, 'options': opts},
+                             sort_keys=True)
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, 'objects', key[:2], key)
+
+    def __contains__(self, key):
+        return os.path.isdir(self._entry(key))
+
+    def retrieve(self, url, key, path, unpack=False, overwrite=False):
+        """Materialize a product in a directory, downloading it only if needed
+
+        Args:
+            url (str): Download url of the product archive
+            key (str): Store key of the product (see ``key()``)
+            path (str): Directory in which the archive (or the directory
+                containing the unpacked archive) is created
+            unpack (bool): Unpack the archive? Packed and unpacked versions of a
+                product are stored independently
+            overwrite (bool): Replace the local file or directory if it already
+                exists in ``path``? Defaults to False
+
+        Returns:
+            str: Path of the materialized file or directory
+        """
+        filename = url.split('/')[-1]
+        name = filename.split('.')[0] if unpack else filename
+        dst = os.path.join(path, name)
+        if os.path.exists(dst):
+            if not overwrite:
+                return dst
+            if os.path.isdir(dst):
+                shutil.rmtree(dst)
+            else:
+                os.remove(dst)
+        entry = self._entry(key)
+        src = os.path.join(entry, 'unpacked' if unpack else 'packed', name)
+        if not os.path.exists(src):
+            print('%s not in store, downloading' % filename)
+            # Download to a temporary location first, so that an interrupted
+            # download never leaves an incomplete entry in the store
+            tmp = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+            os.makedirs(tmp)
+            try:
+                if unpack:
+                    url_retrieve_and_unpack(url, tmp)
+                else:
+                    url_retrieve(url, os.path.join(tmp, filename))
+                if not os.path.isdir(os.path.dirname(src)):
+                    os.makedirs(os.path.dirname(src))
+                os.rename(os.path.join(tmp, name), src)
+            except OSError:
+                # Concurrent retrieval of the same content
+                if not os.path.exists(src):
+                    raise
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+            if self.max_size is not None:
+                self.gc(exclude=[key])
+        # Entries modification time is used to track usage
+        os.utime(entry, None)
+        if unpack:
+            _link_tree(src, dst)
+        else:
+            _link(src, dst)
+        return dst
+
+    @property
+    def size(self):
+        """Total size of the store entries in bytes"""
+        return _du(os.path.join(self.root, 'objects'))
+
+    def gc(self, max_size=None, exclude=None):
+        """Remove least recently used entries until the store fits a given size
+
+        Note that the disk space of a removed entry is only freed once all
+        hardlinks to its files have been removed as well
+
+        Args:
+            max_size (int): Maximum size of the store in bytes. Defaults to the
+                ``max_size`` attribute
+            exclude (list): Keys of entries that must not be removed
+
+        Returns:
+            int: Number of bytes removed from the store
+        """
+        max_size = self.max_size if max_size is None else max_size
+        exclude = set(exclude or [])
+        objects = os.path.join(self.root, 'objects')
+        entries = []
+        for prefix in os.listdir(objects):
+            for key in os.listdir(os.path.join(objects, prefix)):
+                entry = os.path.join(objects, prefix, key)
+                entries.append((os.path.getmtime(entry), _du(entry), key, entry))
+        total = sum(x[1] for x in entries)
+        removed = 0
+        for mtime, size, key, entry in sorted(entries):
+            if total - removed <= max_size:
+                break
+            if key in exclude:
+                continue
+            shutil.rmtree(entry)
+            removed += size
+        return removed
@@ -0,0 +1,189 @@
+import os
+import copy
+import json
+import datetime
+
+from .utils import bounds
+
+
+class Watchlist(object):
+    """Persistent collection of areas of interest (AOIs) monitored for new acquisitions
+
+    The state of each AOI (query parameters, date of the last acquisition seen
+    and ids of the scenes already known) is stored in a json file, so that
+    recurring runs only query the Usgs API for the time window that follows
+    the previous run and only return scenes that were not seen before.
+
+    Args:
+        filename (str): Path of the json file in which the watchlist state is
+            persisted. Created on the first call to ``save()`` if it does not
+            exist yet
+
+    Attributes:
+        filename (str): Path of the state file
+        aois (dict): Dictionary of AOI states, keyed by AOI name
+
+    Example:
+        >>> from lsru import Usgs
+        >>> from lsru.sync import Watchlist
+        >>> import datetime
+        >>> usgs = Usgs()
+        >>> usgs.login()
+        >>> watchlist = Watchlist('/path/to/watchlist.json')
+        >>> watchlist.add('montpellier', (3.5, 43.4, 4, 44),
+        ...               collection='LANDSAT_8_C1',
+        ...               begin=datetime.datetime(2018,1,1))
+        >>> new_scenes = watchlist.sync(usgs)
+        >>> print({k:len(v) for k,v in new_scenes.items()})
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.aois = {}
+        if os.path.isfile(filename):
+            with open(filename) as src:
+                self.aois = json.load(src)
+
+    def add(self, name, aoi, collection, begin=None, max_cloud_cover=100,
+            months=None):
+        """Add an area of interest to the watchlist
+
+        Args:
+            name (str): Unique name of the AOI
+            aoi (tuple or dict): Bounding box in the form of a (left, bottom,
+                right, top) tuple or geojson like geometry, in which case its
+                bounding box is used for the queries
+            collection (str): Landsat collection to monitor (see
+                ``Usgs.get_collection_name``)
+            begin (datetime.datetime): Optional date from which acquisitions
+                are considered. The first sync queries the full archive when
+                not set
+            max_cloud_cover (int): Cloud cover threshold to use for the queries
+            months (list): Optional list of month indices (1,12) to limit the
+                queries to
+
+        Returns:
+            dict: The initial state of the AOI
+        """
+        if name in self.aois:
+            raise ValueError('An AOI named %s already exists in the watchlist' % name)
+        if isinstance(aoi, dict):
+            aoi = bounds(aoi)
+        state = {'bbox': list(aoi),
+                 'collection': collection,
+                 'max_cloud_cover': max_cloud_cover,
+                 'months': months,
+                 'begin': None if begin is None else begin.date().isoformat(),
+                 'last_date': None,
+                 'scene_ids': {}}
+        self.aois[name] = state
+        return state
+
+    def remove(self, name):
+        """Remove an area of interest from the watchlist
+
+        Args:
+            name (str): Name of the AOI to remove
+        """
+        del self.aois[name]
+
+    def save(self):
+        """Write the watchlist state to its json file
+
+        The file is first written to a temporary file and then moved in place,
+        so that an interrupted run never leaves a corrupted state behind
+        """
+        tmp = '%s.tmp' % self.filename
+        with open(tmp, 'w') as dst:
+            json.dump(self.aois, dst, indent=2, sort_keys=True)
+        os.replace(tmp, self.filename)
+
+    def sync(self, usgs, overlap=16, save=True):
+        """Query the Usgs API for acquisitions not seen during previous syncs
+
+        For each AOI, only the time window starting ``overlap`` days before the
+        last known acquisition is queried. Scenes already known are filtered
+        out, so that late catalog ingestions within the overlap window are
+        caught without being reported twice.
+
+        Args:
+            usgs (lsru.Usgs): Usgs instance. ``login()`` is (re-)run
+                automatically when no key is available or when it is about to
+                expire
+            overlap (int): Number of days before the last known acquisition
+                to re-query. Defaults to 16 (one Landsat revisit cycle)
+            save (bool): Persist the updated state once all AOIs have been
+                queried. Defaults to ``True``
+
+        Returns:
+            dict: Dictionary of lists of new scenes metadata, keyed by AOI
+            name. AOIs without new acquisitions have an empty list
+        """
+        new_scenes = {}
+        for name, state in self.aois.items():
+            if usgs.key is None or usgs.key_age > datetime.timedelta(0, 3300):
+                usgs.login()
+            begin = None
+            if state.get('begin') is not None:
+                begin = datetime.datetime.strptime(state['begin'], '%Y-%m-%d')
+            if state['last_date'] is not None:
+                last_date = datetime.datetime.strptime(state['last_date'],
+                                                       '%Y-%m-%d')
+                window = last_date - datetime.timedelta(days=overlap)
+                # The overlap window never extends before the requested begin
+                begin = window if begin is None else max(begin, window)
+            scene_list = usgs.search(collection=state['collection'],
+                                     bbox=tuple(state['bbox']),
+                                     begin=begin,
+                                     max_cloud_cover=state['max_cloud_cover'],
+                                     months=state['months'])
+            known = state['scene_ids']
+            new_scenes[name] = [x for x in scene_list
+                                if x['displayId'] not in known]
+            for scene in new_scenes[name]:
+                known[scene['displayId']] = scene['acquisitionDate']
+            if known:
+                state['last_date'] = max([state['last_date'] or ''] +
+                                         list(known.values()))
+                # Only ids that may show up again in the next query window
+                # need to be remembered
+                last_date = datetime.datetime.strptime(state['last_date'],
+                                                       '%Y-%m-%d')
+                threshold = (last_date - datetime.timedelta(days=overlap)).date().isoformat()
+                state['scene_ids'] = {k:v for k,v in known.items()
+                                      if v >= threshold}
+        if save:
+            self.save()
+        return new_scenes
+
+    def sync_and_order(self, usgs, espa, products, overlap=16, **kwargs):
+        """Sync the watchlist and place an Espa order for all new scenes
+
+        The watchlist state is only updated and persisted once the order has
+        been placed, so that new scenes are reported again by the next sync if
+        ordering fails
+
+        Args:
+            usgs (lsru.Usgs): Usgs instance
+            espa (lsru.Espa): Espa instance used to place the order
+            products (list): List of products to order (see ``Espa.order``)
+            overlap (int): Number of days before the last known acquisition
+                to re-query (see ``sync``)
+            **kwargs: Additional arguments passed to ``Espa.order``
+
+        Returns:
+            tuple: The dictionary of new scenes returned by ``sync`` and the
+            ``lsru.Order`` placed (``None`` when there was nothing to order)
+        """
+        previous = copy.deepcopy(self.aois)
+        new_scenes = self.sync(usgs, overlap=overlap, save=False)
+        scene_list = sorted(set(x['displayId'] for v in new_scenes.values()
+                                for x in v))
+        order = None
+        if scene_list:
+            try:
+                order = espa.order(scene_list, products=products, **kwargs)
+            except Exception:
+                self.aois = previous
+                raise
+        self.save()
+        return new_scenes, order
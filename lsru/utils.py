@@ -1,12 +1,17 @@
 import re
 import os
-from io import BytesIO
+import json
+import time
+import uuid
+import zlib
+import shutil
+import codecs
+import socket
+import threading
 import tarfile
 from contextlib import closing
 from datetime import datetime, date
 
-import requests
-
 
 def bounds(geom):
     """Return a bounding box from a geometry
@@ -115,7 +120,91 @@ def is_valid(id):
         return True
 
 
-def url_retrieve(url, filename, overwrite=False, check_complete=True):
+def iter_json_array(chunks, key):
+    """Incrementally decode the elements of an array nested in a json document
+
+    Elements of the first array found under ``key`` are decoded and yielded one
+    by one as the document bytes arrive, so that only the element being
+    decoded (and not the full document) is held in memory.
+
+    Args:
+        chunks (iterable): Iterable of bytes chunks making up the json document
+            (e.g. ``requests.Response.iter_content()``)
+        key (str): Name of the member holding the array to iterate over
+
+    Example:
+        >>> from lsru.utils import iter_json_array
+        >>> chunks = [b'{"data": {"res', b'ults": [{"a": 1}, {"a"', b': 2}]}}']
+        >>> print(list(iter_json_array(chunks, 'results')))
+        [{'a': 1}, {'a': 2}]
+
+    Returns:
+        generator: Generator of decoded array elements. Yields nothing when
+        ``key`` is not found in the document
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    whitespace = re.compile(r'[\s,]*')
+    chunks = iter(chunks)
+    buf = ''
+    pos = None
+    eof = False
+    def read():
+        for chunk in chunks:
+            if chunk:
+                return text_decoder.decode(chunk)
+        return None
+    # Locate the beginning of the array
+    while pos is None:
+        chunk = read()
+        if chunk is None:
+            return
+        # Keep a few characters in case the key is split across chunks
+        start = max(0, len(buf) - len(key) - 32)
+        buf += chunk
+        m = pattern.search(buf, start)
+        if m is not None:
+            buf = buf[m.end():]
+            pos = 0
+    while True:
+        pos = whitespace.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        if pos < len(buf):
+            try:
+                element, end = decoder.raw_decode(buf, pos)
+                # Make sure a number is not truncated by the end of the buffer
+                if eof or (end < len(buf) and buf[end] in ' \t\r\n,]'):
+                    pos = end
+                    yield element
+                    continue
+            except ValueError:
+                if eof:
+                    raise
+        chunk = read()
+        if chunk is None:
+            if eof:
+                raise ValueError('Unexpected end of json document')
+            eof = True
+            continue
+        buf = buf[pos:] + chunk
+        pos = 0
+
+
+def _chunk_size(response, chunk_size=None):
+    """Transfer chunk size; adapted to the expected response size when not set"""
+    if chunk_size is not None:
+        return chunk_size
+    length = int(response.headers.get('Content-Length', 0))
+    if not length:
+        return 1024 * 1024
+    # Aim at about a hundred chunks per transfer, between 64KB and 8MB
+    return min(max(length // 128, 64 * 1024), 8 * 1024 * 1024)
+
+
+def url_retrieve(url, filename, overwrite=False, check_complete=True,
+                 throttle=None, chunk_size=None):
     """Generic file download function
 
     Similar to url_retrieve from standard library with additional checks for
@@ -131,10 +220,18 @@ def url_retrieve(url, filename, overwrite=False, check_complete=True):
             check whether local and remote file sizes match? File is re-downloaded
             when sizes are different. Only makes sense if overwrite is set to False.
             Defaults to True
+        throttle (callable): Optional callable, called with the number of bytes
+            received after each chunk is written. May block to limit the
+            transfer rate (see ``lsru.scheduler.Throttle``)
+        chunk_size (int): Size in bytes of the chunks read from the network and
+            written to disk. Defaults to a size adapted to the file size, between
+            64KB and 8MB
 
     Returns:
         str: The filename
     """
+    # requests is imported lazily to keep ``import lsru`` fast
+    import requests
     # Handle special cases (file already exists, no overwrite, check integrity)
     if os.path.isfile(filename) and not overwrite:
         if not check_complete:
@@ -144,18 +241,25 @@ def url_retrieve(url, filename, overwrite=False, check_complete=True):
             return filename
     # Proceed to download
     r = requests.get(url, stream=True)
-    with open(filename, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=1024):
+    with closing(r), open(filename, 'wb') as f:
+        for chunk in r.iter_content(chunk_size=_chunk_size(r, chunk_size)):
             if chunk:
                 f.write(chunk)
+                if throttle is not None:
+                    throttle(len(chunk))
     return filename
 
 
-def url_retrieve_and_unpack(url, path, overwrite=False):
+def url_retrieve_and_unpack(url, path, overwrite=False, throttle=None,
+                            stack=None, stack_dtype=None, chunk_size=None,
+                            decompressor=None):
     """Generic function to combine download and unpacking of tar archives
 
-    Downloads the tar archive as a memory object and extracts its content to a
-    new directory. Directory name is the remote file name with stripped extension
+    Streams the tar archive and extracts its content to a new directory as it
+    is received, without holding the archive in memory. Directory name is the
+    remote file name with stripped extension. Content is extracted to a
+    temporary directory that is only renamed once the archive has been fully
+    received, so that the directory is never left incomplete
 
     Args:
         url (str): Url pointing to tar file to retrieve
@@ -163,6 +267,20 @@ def url_retrieve_and_unpack(url, path, overwrite=False):
             archive content will be created
         overwrite (bool): Force overwriting local files even when the output
             directory already exist? Defaults to False
+        throttle (callable): Optional callable, called with the number of bytes
+            received after each chunk (see ``url_retrieve``)
+        stack (list): Optional list of band names (e.g. ``['sr_band4',
+            'sr_band5']``). When set, these bands are not extracted as
+            individual files but written to a single memory mappable array
+            file while unpacking (see ``lsru.stack.stack_archive``). Requires
+            ``numpy`` and ``rasterio``, and archives in GeoTIFF format
+        stack_dtype (str): Optional data type of the stack. Required when the
+            stacked bands do not all have the same data type
+        chunk_size (int): Size in bytes of the chunks read from the network
+            (see ``url_retrieve``)
+        decompressor (str): Name of the gzip decompression backend to use (see
+            ``lsru.decompress.get_decompressor``). Defaults to the fastest
+            backend installed
 
     Returns:
         str: The path containing extracted content
@@ -171,7 +289,165 @@ def url_retrieve_and_unpack(url, path, overwrite=False):
     path = os.path.join(path, folder)
     if os.path.isdir(path) and not overwrite:
         return path
-    r = requests.get(url)
-    with closing(r), tarfile.open(fileobj=BytesIO(r.content)) as archive:
-        archive.extractall(path=path)
+    import requests
+    from .decompress import DecompressingReader
+    r = requests.get(url, stream=True)
+    chunk_size = _chunk_size(r, chunk_size)
+    def chunks():
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+                if throttle is not None:
+                    throttle(len(chunk))
+    reader = DecompressingReader(chunks(), decompressor=decompressor)
+    # Extract to a temporary sibling directory, moved in place only once the
+    # whole archive has been received, so that an interrupted transfer never
+    # leaves a partial directory that would later be taken for a complete one
+    tmp = '%s.part-%s' % (path, uuid.uuid4().hex)
+    try:
+        with closing(r), tarfile.open(fileobj=reader, mode='r|',
+                                      bufsize=chunk_size) as archive:
+            if stack:
+                from .stack import stack_archive
+                stack_archive(archive, tmp, folder, stack, dtype=stack_dtype)
+            else:
+                archive.extractall(path=tmp)
+        if not os.path.isdir(tmp):
+            os.makedirs(tmp)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
     return path
+
+
+def in_shard(name, shard):
+    """Deterministically assign a name to one of several shards
+
+    The assignment only depends on the name, so that independent processes
+    working on the same list of files agree on the partitioning, whatever the
+    order of the list
+
+    Args:
+        name (str): Name to assign (e.g. archive file name)
+        shard (tuple): Shard in the form of a (index, count) tuple, with
+            0 <= index < count
+
+    Returns:
+        bool: Whether name belongs to the shard
+    """
+    index, count = shard
+    if not 0 <= index < count:
+        raise ValueError('Shard index must be in [0, %d)' % count)
+    return zlib.crc32(name.encode('utf-8')) % count == index
+
+
+class FileClaim(object):
+    """Exclusive claim on a unit of work, materialized by a lock file
+
+    Lock files are created atomically and hold a token unique to the claim,
+    which makes claims usable across processes and machines sharing a
+    filesystem. The lock file of an acquired
+    claim is touched regularly; a claim whose lock file has not been touched
+    for ``stale_after`` seconds (e.g. because its owner crashed) is considered
+    stale and can be taken over.
+
+    Args:
+        filename (str): Path of the lock file
+        stale_after (float): Age in seconds after which a claim is considered
+            stale. Defaults to 600
+
+    Example:
+        >>> from lsru.utils import FileClaim
+        >>> claim = FileClaim('/shared/dir/.archive.tar.gz.claim')
+        >>> if claim.acquire():
+        ...     try:
+        ...         pass # Do the work
+        ...     finally:
+        ...         claim.release()
+    """
+    def __init__(self, filename, stale_after=600):
+        self.filename = filename
+        self.stale_after = stale_after
+        self.token = '%s %d %s' % (socket.gethostname(), os.getpid(),
+                                   uuid.uuid4().hex)
+        self._stop = None
+
+    def _is_stale(self, filename):
+        try:
+            return time.time() - os.path.getmtime(filename) > self.stale_after
+        except OSError:
+            return False
+
+    def acquire(self):
+        """Attempt to acquire the claim
+
+        Returns:
+            bool: True if the claim was acquired, False if it is held elsewhere
+        """
+        while True:
+            try:
+                fd = os.open(self.filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if not self._is_stale(self.filename):
+                    return False
+                # Move the stale lock out of the way; only one of the
+                # contenders can succeed
+                stale = '%s.%s' % (self.filename, uuid.uuid4().hex)
+                try:
+                    os.rename(self.filename, stale)
+                except OSError:
+                    return False
+                if not self._is_stale(stale):
+                    # Another contender recovered the claim in the meantime and
+                    # we moved its fresh lock; put it back
+                    try:
+                        os.link(stale, self.filename)
+                    except OSError:
+                        pass
+                    os.remove(stale)
+                    return False
+                os.remove(stale)
+        with os.fdopen(fd, 'w') as dst:
+            dst.write(self.token)
+        self._stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(self._stop,))
+        heartbeat.daemon = True
+        heartbeat.start()
+        return True
+
+    @property
+    def owned(self):
+        """Whether the lock file currently holds the token of this claim"""
+        try:
+            with open(self.filename) as src:
+                return src.read() == self.token
+        except OSError:
+            return False
+
+    def _heartbeat(self, stop):
+        while not stop.wait(self.stale_after / 4.0):
+            # The claim may have been taken over after going stale
+            if not self.owned:
+                return
+            try:
+                os.utime(self.filename, None)
+            except OSError:
+                pass
+
+    def release(self):
+        """Release the claim and remove its lock file
+
+        The lock file is left untouched if the claim has been taken over by
+        another process in the meantime
+        """
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        if self.owned:
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
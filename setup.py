@@ -16,7 +16,10 @@ with open('lsru/__init__.py') as f:
 
 
 extra_reqs = {'docs': ['sphinx',
-                       'sphinx-rtd-theme']}
+                       'sphinx-rtd-theme'],
+              'stack': ['numpy',
+                        'rasterio'],
+              'fast': ['isal']}
 
 with codecs.open('README.rst', encoding='utf-8') as f:
     readme = f.read()
@@ -41,5 +44,8 @@ setup(name='lsru',
       install_requires=[
           'requests',
       ],
+      entry_points={
+          'console_scripts': ['lsru=lsru.cli:main'],
+      },
       extras_require=extra_reqs)
 
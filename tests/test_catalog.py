@@ -0,0 +1,51 @@
+import math
+
+from lsru.catalog import write_catalog, Catalog
+from lsru.utils import geom_from_metadata
+
+
+def make_scene(i):
+    def corner(x, y):
+        return {'longitude': x, 'latitude': y}
+    return {'displayId': 'LC08_L1TP_029030_201702%02d_20170319_01_T1' % (i + 1),
+            'entityId': 'LC80290302017%03dLGN00' % (i + 1),
+            'acquisitionDate': '2017-02-%02d' % (i + 1),
+            'cloudCover': str(i * 10),
+            'browseUrl': 'https://example.com/%d.jpg' % i,
+            'lowerLeftCoordinate': corner(i, 40),
+            'upperLeftCoordinate': corner(i, 41),
+            'upperRightCoordinate': corner(i + 1, 41),
+            'lowerRightCoordinate': corner(i + 1, 40)}
+
+
+def test_round_trip(tmpdir):
+    filename = str(tmpdir.join('catalog.lsru'))
+    scenes = [make_scene(i) for i in range(5)]
+    assert write_catalog(iter(scenes), filename, fields=['browseUrl']) == 5
+    with Catalog(filename) as catalog:
+        assert len(catalog) == 5
+        for scene, record in zip(scenes, catalog):
+            for k in ('displayId', 'entityId', 'acquisitionDate', 'browseUrl'):
+                assert record[k] == scene[k]
+            assert record['cloudCover'] == float(scene['cloudCover'])
+            assert geom_from_metadata(record) == geom_from_metadata(scene)
+        assert list(catalog.column('cloudCover')) == [0., 10., 20., 30., 40.]
+        assert catalog[-1]['displayId'] == scenes[-1]['displayId']
+
+
+def test_close_with_slices(tmpdir):
+    filename = str(tmpdir.join('catalog.lsru'))
+    write_catalog([make_scene(i) for i in range(3)], filename)
+    with Catalog(filename) as catalog:
+        footprint = catalog.column('footprint')[0:8]
+        assert list(footprint) == [0., 40., 0., 41., 1., 41., 1., 40.]
+        catalog[1]
+
+
+def test_missing_cloud_cover(tmpdir):
+    filename = str(tmpdir.join('catalog.lsru'))
+    scene = make_scene(0)
+    del scene['cloudCover']
+    write_catalog([scene], filename)
+    with Catalog(filename) as catalog:
+        assert math.isnan(catalog[0]['cloudCover'])
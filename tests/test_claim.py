@@ -0,0 +1,85 @@
+import os
+import time
+
+from lsru import Order
+from lsru.utils import FileClaim, in_shard
+
+
+def test_exclusive(tmpdir):
+    filename = str(tmpdir.join('archive.claim'))
+    a = FileClaim(filename)
+    b = FileClaim(filename)
+    assert a.acquire()
+    assert not b.acquire()
+    a.release()
+    assert not os.path.exists(filename)
+    assert b.acquire()
+    b.release()
+
+
+def test_stale_claim_taken_over(tmpdir):
+    filename = str(tmpdir.join('archive.claim'))
+    a = FileClaim(filename, stale_after=60)
+    b = FileClaim(filename, stale_after=60)
+    assert a.acquire()
+    a._stop.set() # Simulate a crashed owner
+    old = time.time() - 120
+    os.utime(filename, (old, old))
+    assert b.acquire()
+    # Releasing the stale claim must not remove the live one
+    a.release()
+    assert os.path.exists(filename)
+    assert b.owned
+    b.release()
+    assert not os.path.exists(filename)
+
+
+def test_in_shard():
+    names = ['archive_%d.tar.gz' % i for i in range(100)]
+    counts = [sum(in_shard(x, (i, 3)) for i in range(3)) for x in names]
+    assert counts == [1] * 100
+
+
+def test_claimed_archives_are_retried(tmpdir, monkeypatch):
+    path = str(tmpdir)
+    items = [{'status': 'complete', 'name': 'S%d' % i,
+              'product_dload_url': 'https://example.com/S%d.tar.gz' % i}
+             for i in range(2)]
+    order = Order.__new__(Order)
+    monkeypatch.setattr(Order, 'items_status', items)
+    downloaded = []
+    def download_item(self, item, path, **kwargs):
+        downloaded.append(item['name'])
+        return True
+    monkeypatch.setattr(Order, '_download_item', download_item)
+    # S1 is claimed by another process that then crashes
+    other = FileClaim(os.path.join(path, '.S1.tar.gz.claim'), stale_after=0.2)
+    assert other.acquire()
+    other._stop.set()
+    order.download_all_complete(path, claim=True, stale_after=0.2)
+    assert downloaded == ['S0', 'S1']
+    assert os.path.exists(os.path.join(path, '.S1.tar.gz.done'))
+    assert not os.path.exists(os.path.join(path, '.S1.tar.gz.claim'))
+
+
+def test_done_checked_after_acquire(tmpdir, monkeypatch):
+    path = str(tmpdir)
+    items = [{'status': 'complete', 'name': 'S0',
+              'product_dload_url': 'https://example.com/S0.tar.gz'}]
+    order = Order.__new__(Order)
+    monkeypatch.setattr(Order, 'items_status', items)
+    downloaded = []
+    def download_item(self, item, path, **kwargs):
+        downloaded.append(item['name'])
+        return True
+    monkeypatch.setattr(Order, '_download_item', download_item)
+    # Another process completes the archive and releases its claim between
+    # the done marker check and the claim acquisition
+    acquire = FileClaim.acquire
+    def acquire_after_other(self):
+        open(os.path.join(path, '.S0.tar.gz.done'), 'w').close()
+        return acquire(self)
+    monkeypatch.setattr(FileClaim, 'acquire', acquire_after_other)
+    order.download_all_complete(path, claim=True)
+    assert downloaded == []
+    assert not os.path.exists(os.path.join(path, '.S0.tar.gz.claim'))
@@ -0,0 +1,76 @@
+import io
+import gzip
+import tarfile
+
+import pytest
+
+from lsru.decompress import DecompressingReader
+
+
+def chunked(data, size=1000):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.fixture
+def tar_bytes():
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as archive:
+        for i in range(3):
+            data = bytes(range(256)) * 100 * (i + 1)
+            info = tarfile.TarInfo('f%d' % i)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def test_single_member(tar_bytes):
+    reader = DecompressingReader(chunked(gzip.compress(tar_bytes)))
+    assert reader.read() == tar_bytes
+
+
+def test_concatenated_members(tar_bytes):
+    data = gzip.compress(tar_bytes[:5000]) + gzip.compress(tar_bytes[5000:])
+    assert DecompressingReader(chunked(data)).read() == tar_bytes
+
+
+def test_zero_padding(tar_bytes):
+    data = gzip.compress(tar_bytes) + b'\0' * 2500
+    assert gzip.decompress(data) == tar_bytes
+    assert DecompressingReader(chunked(data)).read() == tar_bytes
+    data = gzip.compress(tar_bytes[:5000]) + b'\0' * 10 + gzip.compress(tar_bytes[5000:])
+    assert DecompressingReader(chunked(data)).read() == tar_bytes
+
+
+def test_truncated(tar_bytes):
+    data = gzip.compress(tar_bytes)
+    with pytest.raises(EOFError):
+        DecompressingReader(chunked(data[:len(data) // 2])).read()
+
+
+def test_truncated_tar_stream(tar_bytes):
+    data = gzip.compress(tar_bytes)
+    reader = DecompressingReader(chunked(data[:len(data) // 2]))
+    with pytest.raises(EOFError):
+        with tarfile.open(fileobj=reader, mode='r|') as archive:
+            [x.name for x in archive]
+
+
+def test_passthrough(tar_bytes):
+    assert DecompressingReader(chunked(tar_bytes)).read() == tar_bytes
+
+
+def test_bounded_output(tar_bytes):
+    data = b'\0' * 10 * 1024**2
+    reader = DecompressingReader([gzip.compress(data)], max_output=64 * 1024)
+    out = []
+    while True:
+        block = reader.read(1024**2)
+        if not block:
+            break
+        assert len(reader._buf) <= 64 * 1024
+        out.append(block)
+    assert b''.join(out) == data
+    # Output limit smaller than the compressed chunks, across members
+    data = gzip.compress(tar_bytes[:5000]) + gzip.compress(tar_bytes[5000:])
+    reader = DecompressingReader(chunked(data, 100000), max_output=7)
+    assert reader.read() == tar_bytes
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import json
+import datetime
+
+import pytest
+import requests
+
+from lsru import Usgs
+from lsru.utils import iter_json_array
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+DOCUMENTS = [
+    {'errorCode': None, 'data': {'totalHits': 3, 'results': [
+        {'displayId': 'LC08_L1TP_029030_20170221_20170319_01_T1',
+         'cloudCover': 12.5, 'sceneBounds': [-104.5, 40.1, -101.7, 42.3],
+         'summary': u'Entité, Ñandú, 北京 ☃ "quoted" \\\\',
+         'nested': {'results': [1, 2], 'empty': []}},
+        123456789, -0.25, 1e-05, True, None, u'Zürich',
+        [1, [2, [3]]]]}},
+    {'data': {'results': []}},
+    {'results': [0]},
+    {'data': {'results': [{}, [], "", 0]}, 'after': [1, 2, 3]},
+]
+
+
+@pytest.mark.parametrize('doc', DOCUMENTS)
+@pytest.mark.parametrize('indent', [None, 2])
+def test_chunk_sizes(doc, indent):
+    data = json.dumps(doc, indent=indent, ensure_ascii=False).encode('utf-8')
+    expected = json.loads(data.decode('utf-8'))
+    if 'data' in expected:
+        expected = expected['data']['results']
+    else:
+        expected = expected['results']
+    for size in range(1, len(data) + 1):
+        assert list(iter_json_array(chunked(data, size), 'results')) == expected
+
+
+def test_missing_key():
+    data = json.dumps({'errorCode': 'AUTH_INVALID', 'data': None}).encode('utf-8')
+    for size in range(1, len(data) + 1):
+        assert list(iter_json_array(chunked(data, size), 'results')) == []
+
+
+def test_truncated_document():
+    data = json.dumps({'results': [{'a': 1}, {'a': 2}]}).encode('utf-8')
+    with pytest.raises(ValueError):
+        list(iter_json_array(chunked(data[:-8], 3), 'results'))
+
+
+class FakeResponse(object):
+    def __init__(self, content):
+        self.content = content
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def usgs():
+    usgs = Usgs.__new__(Usgs)
+    usgs.endpoint = 'https://example.com/inventory/json/v/stable'
+    usgs.key = 'key'
+    usgs.key_dt = datetime.datetime.now()
+    return usgs
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_iter_search(usgs, monkeypatch, chunk_size):
+    doc = DOCUMENTS[0]
+    monkeypatch.setattr(requests, 'post', lambda url, data, stream:
+                        FakeResponse(json.dumps(doc).encode('utf-8')))
+    scenes = usgs.iter_search('LANDSAT_8_C1', (0, 0, 1, 1),
+                              chunk_size=chunk_size)
+    assert list(scenes) == doc['data']['results']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_iter_search_error(usgs, monkeypatch, chunk_size):
+    doc = {'errorCode': 'AUTH_UNAUTHORIZED', 'error': 'Invalid api key',
+           'data': None}
+    monkeypatch.setattr(requests, 'post', lambda url, data, stream:
+                        FakeResponse(json.dumps(doc).encode('utf-8')))
+    with pytest.raises(ValueError) as e:
+        list(usgs.iter_search('LANDSAT_8_C1', (0, 0, 1, 1),
+                              chunk_size=chunk_size))
+    assert 'AUTH_UNAUTHORIZED' in str(e.value)
+    # No results and no error
+    doc = {'errorCode': None, 'data': {'results': []}}
+    assert list(usgs.iter_search('LANDSAT_8_C1', (0, 0, 1, 1),
+                                 chunk_size=chunk_size)) == []
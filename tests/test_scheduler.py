@@ -0,0 +1,48 @@
+import time
+from collections import namedtuple
+
+from lsru import scheduler
+from lsru.scheduler import DownloadScheduler
+
+
+Usage = namedtuple('Usage', ['total', 'used', 'free'])
+URL = ('https://edclpdsftp.cr.usgs.gov/orders/espa-xxx/'
+       'LC080330532018012601T1-SC20181022102816.tar.gz')
+
+
+class FakeOrder(object):
+    urls_completed = [URL]
+
+
+def test_existing_output_skips_admission(tmpdir, monkeypatch):
+    monkeypatch.setattr(scheduler.shutil, 'disk_usage',
+                        lambda path: Usage(100, 100, 0))
+    tmpdir.mkdir('LC080330532018012601T1-SC20181022102816')
+    s = DownloadScheduler(str(tmpdir), unpack=True)
+    s.add(FakeOrder())
+    job, size = s._next_job()
+    assert job[2] == URL
+    assert size == 0
+    assert not s.deferred
+
+
+def test_wait_for_running_jobs(tmpdir, monkeypatch):
+    monkeypatch.setattr(scheduler.shutil, 'disk_usage',
+                        lambda path: Usage(100, 0, 100))
+    def url_retrieve(url, filename, overwrite=False, throttle=None):
+        time.sleep(0.2)
+        return filename
+    monkeypatch.setattr(scheduler, 'url_retrieve', url_retrieve)
+    sizes = {URL: 60, URL.replace('20181022', '20181023'): 60,
+             URL.replace('20181022', '20181024'): 150}
+    monkeypatch.setattr(DownloadScheduler, '_required_space',
+                        lambda self, url: sizes[url])
+    order = FakeOrder()
+    order.urls_completed = list(sizes)
+    s = DownloadScheduler(str(tmpdir), workers=2)
+    s.add(order)
+    results = s.run()
+    # Second job waits for the first one to complete; only the job that
+    # cannot fit at all is deferred
+    assert len(results) == 2
+    assert [job[2] for job in s.deferred] == [order.urls_completed[2]]
@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from lsru import Usgs
+from lsru.spatial import (STRtree, cluster_bounds, intersects,
+                          _bbox_intersects)
+
+
+def random_bbox(rng, max_size=5):
+    x, y = rng.uniform(-180, 175), rng.uniform(-90, 85)
+    return (x, y, x + rng.uniform(0, max_size), y + rng.uniform(0, max_size))
+
+
+def polygon(left, bottom, right, top):
+    return {'type': 'Polygon',
+            'coordinates': [[[left, bottom], [left, top], [right, top],
+                             [right, bottom], [left, bottom]]]}
+
+
+@pytest.mark.parametrize('node_capacity', [2, 3, 10, 50])
+def test_strtree_query(node_capacity):
+    rng = random.Random(node_capacity)
+    bbox_list = [random_bbox(rng, 20) for _ in range(500)]
+    tree = STRtree(bbox_list, node_capacity=node_capacity)
+    for _ in range(100):
+        bbox = random_bbox(rng, 30)
+        expected = [i for i, x in enumerate(bbox_list)
+                    if _bbox_intersects(x, bbox)]
+        assert sorted(tree.query(bbox)) == expected
+    # Touching boxes intersect
+    assert 0 in tree.query((bbox_list[0][2], bbox_list[0][3], 180, 90))
+
+
+def test_strtree_small():
+    assert STRtree([]).query((0, 0, 1, 1)) == []
+    assert STRtree([(0, 0, 1, 1)]).query((0.5, 0.5, 2, 2)) == [0]
+
+
+def test_cluster_bounds():
+    rng = random.Random(0)
+    bbox_list = [random_bbox(rng, 1) for _ in range(300)]
+    clusters = cluster_bounds(bbox_list, max_size=2.0)
+    assert sorted(i for _, idx in clusters for i in idx) == list(range(300))
+    for bbox, idx in clusters:
+        if len(idx) > 1:
+            assert bbox[2] - bbox[0] <= 2.0 and bbox[3] - bbox[1] <= 2.0
+        for i in idx:
+            b = bbox_list[i]
+            assert bbox[0] <= b[0] and bbox[1] <= b[1]
+            assert b[2] <= bbox[2] and b[3] <= bbox[3]
+    # Boxes larger than max_size are kept on their own
+    assert cluster_bounds([(0, 0, 3, 3), (0.5, 0.5, 1, 1)]) == [
+        ((0, 0, 3, 3), [0]), ((0.5, 0.5, 1, 1), [1])]
+
+
+def test_intersects():
+    square = polygon(0, 0, 10, 10)
+    # Crossing boundaries
+    assert intersects(square, polygon(5, 5, 15, 15))
+    # Containment, both ways
+    assert intersects(square, polygon(2, 2, 3, 3))
+    assert intersects(polygon(2, 2, 3, 3), square)
+    # Touching
+    assert intersects(square, polygon(10, 0, 20, 10))
+    # Disjoint
+    assert not intersects(square, polygon(11, 11, 12, 12))
+    # Disjoint while bounding boxes intersect
+    triangle = {'type': 'Polygon',
+                'coordinates': [[[0, 0], [10, 0], [0, 10], [0, 0]]]}
+    assert not intersects(triangle, polygon(8, 8, 9, 9))
+    assert intersects(triangle, polygon(4, 4, 9, 9))
+    # Inside the hole of a polygon
+    donut = {'type': 'Polygon',
+             'coordinates': [square['coordinates'][0],
+                             [[3, 3], [3, 7], [7, 7], [7, 3], [3, 3]]]}
+    assert not intersects(donut, polygon(4, 4, 6, 6))
+    assert intersects(donut, polygon(1, 1, 2, 2))
+    multi = {'type': 'MultiPolygon',
+             'coordinates': [polygon(20, 20, 21, 21)['coordinates'],
+                             polygon(2, 2, 3, 3)['coordinates']]}
+    assert intersects(multi, square)
+    assert not intersects(multi, polygon(12, 12, 13, 13))
+
+
+def scene(display_id, left, bottom, right, top):
+    return {'displayId': display_id,
+            'lowerLeftCoordinate': {'longitude': left, 'latitude': bottom},
+            'upperLeftCoordinate': {'longitude': left, 'latitude': top},
+            'upperRightCoordinate': {'longitude': right, 'latitude': top},
+            'lowerRightCoordinate': {'longitude': right, 'latitude': bottom}}
+
+
+def test_search_many():
+    scenes = [scene('A', 3, 43, 5, 45),
+              scene('B', 4.2, 43.2, 6, 45),
+              scene('C', -111, 23, -109, 25),
+              scene('D', 100, 0, 102, 2)]
+    queries = []
+    def search(collection, bbox, **kwargs):
+        queries.append(bbox)
+        # Fresh objects for each query, like the api responses
+        return [dict(x) for x in scenes
+                if _bbox_intersects(bbox, (x['lowerLeftCoordinate']['longitude'],
+                                           x['lowerLeftCoordinate']['latitude'],
+                                           x['upperRightCoordinate']['longitude'],
+                                           x['upperRightCoordinate']['latitude']))]
+    usgs = Usgs.__new__(Usgs)
+    usgs.search = search
+    aoi_list = [(3.5, 43.4, 4, 44),
+                polygon(4.1, 43.5, 4.3, 43.7),
+                (-110.5, 24, -110, 24.5),
+                (50, 50, 51, 51)]
+    results = usgs.search_many('LANDSAT_8_C1', aoi_list, max_size=2.0)
+    assert len(queries) == 3
+    assert [sorted(x['displayId'] for x in r) for r in results] == [
+        ['A'], ['A', 'B'], ['C'], []]
+    # Deduplicated scenes are shared between areas of interest
+    assert results[0][0] is [x for x in results[1] if x['displayId'] == 'A'][0]
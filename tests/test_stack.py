@@ -0,0 +1,132 @@
+import io
+import os
+import gzip
+import tarfile
+
+import pytest
+
+from lsru.stack import _band_name, stack_archive, open_stack
+from lsru.utils import url_retrieve_and_unpack
+
+PREFIX = 'LC08_L1TP_029030_20170221_20170319_01_T1'
+
+
+def test_band_name():
+    bands = ['sr_band4', 'pixel_qa']
+    assert _band_name('LC08_L1TP_029030_20170221_20170319_01_T1_sr_band4.tif',
+                      bands) == 'sr_band4'
+    assert _band_name('LC08_L1TP_029030_20170221_20170319_01_T1_pixel_qa.tif',
+                      bands) == 'pixel_qa'
+    assert _band_name('LC08_L1TP_029030_20170221_20170319_01_T1_toa_band4.tif',
+                      bands) is None
+    assert _band_name('LC08_L1TP_029030_20170221_20170319_01_T1_sr_band4.xml',
+                      bands) is None
+
+
+def test_ambiguous_band_name():
+    with pytest.raises(ValueError):
+        _band_name('LC08_L1TP_029030_20170221_20170319_01_T1_sr_band4.tif',
+                   ['band4', 'sr_band4'])
+
+
+def make_tif(arr):
+    from rasterio.io import MemoryFile
+    from rasterio.transform import from_origin
+    with MemoryFile() as memfile:
+        with memfile.open(driver='GTiff', width=arr.shape[1],
+                          height=arr.shape[0], count=1, dtype=arr.dtype,
+                          crs='EPSG:32631', nodata=0,
+                          transform=from_origin(500000, 4800000, 30, 30)) as dst:
+            dst.write(arr, 1)
+        return memfile.read()
+
+
+def make_tar(members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return buf
+
+
+@pytest.fixture
+def bands():
+    np = pytest.importorskip('numpy')
+    pytest.importorskip('rasterio')
+    return {'sr_band4': np.arange(12, dtype='int16').reshape(3, 4),
+            'sr_band5': np.arange(12, 24, dtype='int16').reshape(3, 4),
+            'pixel_qa': np.full((3, 4), 322, dtype='uint16'),
+            'sr_aerosol': np.full((3, 4), 8, dtype='uint8')}
+
+
+def test_stack_archive(tmpdir, bands):
+    np = pytest.importorskip('numpy')
+    members = [('%s_%s.tif' % (PREFIX, k), make_tif(v)) for k, v in bands.items()]
+    members.append(('%s.xml' % PREFIX, b'<xml/>'))
+    with tarfile.open(fileobj=make_tar(members), mode='r|') as archive:
+        filename = stack_archive(archive, str(tmpdir), PREFIX,
+                                 ['sr_band5', 'sr_band4'])
+    arr, meta = open_stack(filename)
+    assert arr.dtype == np.int16
+    np.testing.assert_array_equal(arr[0], bands['sr_band5'])
+    np.testing.assert_array_equal(arr[1], bands['sr_band4'])
+    assert meta['bands'] == ['sr_band5', 'sr_band4']
+    assert meta['nodata'] == 0
+    assert meta['transform'][:3] == [30, 0, 500000]
+    # Stacked bands are not extracted individually
+    assert sorted(os.listdir(str(tmpdir))) == sorted(
+        ['%s_stack.npy' % PREFIX, '%s_stack.json' % PREFIX,
+         '%s.xml' % PREFIX, '%s_pixel_qa.tif' % PREFIX,
+         '%s_sr_aerosol.tif' % PREFIX])
+
+
+def test_stack_archive_dtype(tmpdir, bands):
+    np = pytest.importorskip('numpy')
+    members = [('%s_%s.tif' % (PREFIX, k), make_tif(v)) for k, v in bands.items()]
+    with tarfile.open(fileobj=make_tar(members), mode='r|') as archive:
+        with pytest.raises(ValueError):
+            stack_archive(archive, str(tmpdir.join('a')), PREFIX,
+                          ['sr_band4', 'sr_aerosol'])
+    # Safe conversion
+    with tarfile.open(fileobj=make_tar(members), mode='r|') as archive:
+        filename = stack_archive(archive, str(tmpdir.join('b')), PREFIX,
+                                 ['sr_band4', 'sr_aerosol'], dtype='int16')
+    arr, meta = open_stack(filename)
+    assert arr.dtype == np.int16
+    np.testing.assert_array_equal(arr[1], bands['sr_aerosol'])
+    # Unsafe conversion
+    with tarfile.open(fileobj=make_tar(members), mode='r|') as archive:
+        with pytest.raises(ValueError):
+            stack_archive(archive, str(tmpdir.join('c')), PREFIX,
+                          ['sr_band4', 'pixel_qa'], dtype='int16')
+
+
+class FakeResponse(object):
+    def __init__(self, content):
+        self.content = content
+        self.headers = {'Content-Length': str(len(content))}
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+
+def test_failed_stack_leaves_no_directory(tmpdir, bands, monkeypatch):
+    requests = pytest.importorskip('requests')
+    members = [('%s_%s.tif' % (PREFIX, k), make_tif(v)) for k, v in bands.items()]
+    content = gzip.compress(make_tar(members).getvalue())
+    monkeypatch.setattr(requests, 'get', lambda url, stream=True:
+                        FakeResponse(content))
+    url = 'https://example.com/%s.tar.gz' % PREFIX
+    with pytest.raises(ValueError):
+        url_retrieve_and_unpack(url, str(tmpdir), stack=['sr_band4', 'sr_band7'])
+    assert tmpdir.listdir() == []
+    path = url_retrieve_and_unpack(url, str(tmpdir), stack=['sr_band4'])
+    arr, meta = open_stack(os.path.join(path, '%s_stack.npy' % PREFIX))
+    assert arr.shape == (1, 3, 4)
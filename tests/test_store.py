@@ -0,0 +1,103 @@
+import os
+
+from lsru import store
+from lsru.store import ProductStore
+
+SCENE = 'LC08_L1TP_029030_20170221_20170319_01_T1'
+URL = ('https://edclpdsftp.cr.usgs.gov/orders/espa-xxx/'
+       'LC080290302017022101T1-SC20181022102816.tar.gz')
+FOLDER = 'LC080290302017022101T1-SC20181022102816'
+
+
+def fake_downloads(monkeypatch):
+    calls = []
+    def url_retrieve(url, filename, **kwargs):
+        calls.append(url)
+        with open(filename, 'wb') as dst:
+            dst.write(b'archive')
+        return filename
+    def url_retrieve_and_unpack(url, path, **kwargs):
+        calls.append(url)
+        path = os.path.join(path, url.split('/')[-1].split('.')[0])
+        os.makedirs(os.path.join(path, 'sub'))
+        for name in ('a.tif', os.path.join('sub', 'b.xml')):
+            with open(os.path.join(path, name), 'wb') as dst:
+                dst.write(b'x' * 10)
+        return path
+    monkeypatch.setattr(store, 'url_retrieve', url_retrieve)
+    monkeypatch.setattr(store, 'url_retrieve_and_unpack', url_retrieve_and_unpack)
+    return calls
+
+
+def test_retrieve_links_stored_content(tmpdir, monkeypatch):
+    calls = fake_downloads(monkeypatch)
+    s = ProductStore(str(tmpdir.join('store')))
+    key = s.key(SCENE, {'format': 'gtiff'})
+    a = s.retrieve(URL, key, str(tmpdir.mkdir('a')))
+    b = s.retrieve(URL, key, str(tmpdir.mkdir('b')))
+    assert calls == [URL]
+    assert key in s
+    assert os.path.basename(a) == os.path.basename(b) == URL.split('/')[-1]
+    assert os.stat(a).st_ino == os.stat(b).st_ino
+    # Packed and unpacked versions are stored independently
+    c = s.retrieve(URL, key, str(tmpdir.mkdir('c')), unpack=True)
+    d = s.retrieve(URL, key, str(tmpdir.mkdir('d')), unpack=True)
+    assert calls == [URL, URL]
+    assert os.path.basename(d) == FOLDER
+    for name in ('a.tif', os.path.join('sub', 'b.xml')):
+        assert (os.stat(os.path.join(c, name)).st_ino ==
+                os.stat(os.path.join(d, name)).st_ino)
+    # Nothing left in the temporary directory of the store
+    assert os.listdir(str(tmpdir.join('store', 'tmp'))) == []
+
+
+def test_retrieve_overwrite(tmpdir, monkeypatch):
+    calls = fake_downloads(monkeypatch)
+    s = ProductStore(str(tmpdir.join('store')))
+    key = s.key(SCENE, {'format': 'gtiff'})
+    path = tmpdir.mkdir('a')
+    path.join(URL.split('/')[-1]).write('local')
+    dst = s.retrieve(URL, key, str(path))
+    assert calls == []
+    assert path.join(URL.split('/')[-1]).read() == 'local'
+    dst = s.retrieve(URL, key, str(path), overwrite=True)
+    assert calls == [URL]
+    with open(dst, 'rb') as src:
+        assert src.read() == b'archive'
+
+
+def test_key():
+    options = {'format': 'gtiff',
+               'note': 'first order',
+               'olitirs8_collection': {'inputs': [SCENE], 'products': ['sr', 'pixel_qa']},
+               'etm7_collection': {'inputs': ['LE07_L1TP_029030_20170213_20170311_01_T1'],
+                                   'products': ['toa']}}
+    other = {'format': 'gtiff',
+             'note': 'second order',
+             'olitirs8_collection': {'inputs': [SCENE, 'LC08_L1TP_029031_20170221_20170319_01_T1'],
+                                     'products': ['pixel_qa', 'sr']}}
+    assert ProductStore.key(SCENE, options) == ProductStore.key(SCENE, other)
+    other['olitirs8_collection']['products'] = ['sr']
+    assert ProductStore.key(SCENE, options) != ProductStore.key(SCENE, other)
+    other['olitirs8_collection']['products'] = ['sr', 'pixel_qa']
+    other['format'] = 'envi'
+    assert ProductStore.key(SCENE, options) != ProductStore.key(SCENE, other)
+
+
+def test_gc(tmpdir, monkeypatch):
+    fake_downloads(monkeypatch)
+    s = ProductStore(str(tmpdir.join('store')))
+    keys = [s.key(SCENE, {'format': f}) for f in ('gtiff', 'envi', 'hdf-eos2')]
+    for i, key in enumerate(keys):
+        s.retrieve(URL, key, str(tmpdir.mkdir('d%d' % i)))
+        # Oldest first
+        os.utime(s._entry(key), (1000 * (i + 1), 1000 * (i + 1)))
+    assert s.size == 3 * len(b'archive')
+    # Least recently used entry is excluded, the next one is removed
+    removed = s.gc(max_size=2 * len(b'archive'), exclude=[keys[0]])
+    assert removed == len(b'archive')
+    assert [key in s for key in keys] == [True, False, True]
+    assert s.gc(max_size=0) == 2 * len(b'archive')
+    assert [key in s for key in keys] == [False, False, False]
+    # Linked files outlive store entries
+    assert tmpdir.join('d1', URL.split('/')[-1]).read() == 'archive'
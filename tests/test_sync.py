@@ -0,0 +1,71 @@
+import datetime
+
+import pytest
+
+from lsru.sync import Watchlist
+
+
+class FakeUsgs(object):
+    key = 'key'
+    key_age = datetime.timedelta(0)
+
+    def __init__(self, scenes):
+        self.scenes = scenes
+        self.queries = []
+
+    def search(self, collection, bbox, begin=None, **kwargs):
+        self.queries.append(begin)
+        return [x for x in self.scenes if begin is None or
+                x['acquisitionDate'] >= begin.date().isoformat()]
+
+
+def test_begin_is_not_extended_by_overlap(tmpdir):
+    usgs = FakeUsgs([{'displayId': 'A', 'acquisitionDate': '2017-12-20'},
+                     {'displayId': 'B', 'acquisitionDate': '2018-01-05'}])
+    watchlist = Watchlist(str(tmpdir.join('watchlist.json')))
+    watchlist.add('aoi', (0, 0, 1, 1), 'LANDSAT_8_C1',
+                  begin=datetime.datetime(2018, 1, 1))
+    new = watchlist.sync(usgs)
+    assert [x['displayId'] for x in new['aoi']] == ['B']
+    assert usgs.queries == [datetime.datetime(2018, 1, 1)]
+    # Overlap window would start before begin
+    assert Watchlist(watchlist.filename).sync(usgs) == {'aoi': []}
+    assert usgs.queries[-1] == datetime.datetime(2018, 1, 1)
+
+
+def test_incremental_sync(tmpdir):
+    usgs = FakeUsgs([{'displayId': 'A', 'acquisitionDate': '2018-01-05'}])
+    watchlist = Watchlist(str(tmpdir.join('watchlist.json')))
+    watchlist.add('aoi', (0, 0, 1, 1), 'LANDSAT_8_C1')
+    assert len(watchlist.sync(usgs)['aoi']) == 1
+    usgs.scenes.append({'displayId': 'B', 'acquisitionDate': '2018-02-01'})
+    new = Watchlist(watchlist.filename).sync(usgs)
+    assert [x['displayId'] for x in new['aoi']] == ['B']
+    assert usgs.queries[-1] == datetime.datetime(2017, 12, 20)
+
+
+class FailingEspa(object):
+    def __init__(self):
+        self.calls = []
+
+    def order(self, scene_list, products, **kwargs):
+        self.calls.append(scene_list)
+        if len(self.calls) == 1:
+            raise ValueError('Espa unavailable')
+        return 'order'
+
+
+def test_failed_order_is_retried(tmpdir):
+    usgs = FakeUsgs([{'displayId': 'A', 'acquisitionDate': '2018-01-05'}])
+    espa = FailingEspa()
+    watchlist = Watchlist(str(tmpdir.join('watchlist.json')))
+    watchlist.add('aoi', (0, 0, 1, 1), 'LANDSAT_8_C1')
+    with pytest.raises(ValueError):
+        watchlist.sync_and_order(usgs, espa, ['sr'])
+    assert watchlist.aois['aoi']['scene_ids'] == {}
+    assert watchlist.aois['aoi']['last_date'] is None
+    # Retry on the same instance
+    new, order = watchlist.sync_and_order(usgs, espa, ['sr'])
+    assert order == 'order'
+    assert espa.calls == [['A'], ['A']]
+    assert Watchlist(watchlist.filename).aois['aoi']['last_date'] == '2018-01-05'
@@ -0,0 +1,60 @@
+import io
+import os
+import gzip
+import tarfile
+
+import pytest
+import requests
+
+from lsru.utils import url_retrieve_and_unpack
+
+URL = ('https://edclpdsftp.cr.usgs.gov/orders/espa-xxx/'
+       'LC080330532018012601T1-SC20181022102816.tar.gz')
+FOLDER = 'LC080330532018012601T1-SC20181022102816'
+
+
+def make_archive(members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return gzip.compress(buf.getvalue())
+
+
+class FakeResponse(object):
+    def __init__(self, content, fail_after=None):
+        self.content = content
+        self.fail_after = fail_after
+        self.headers = {'Content-Length': str(len(content))}
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.content), 1024):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise requests.exceptions.ConnectionError('Connection reset')
+            yield self.content[i:i + 1024]
+
+    def close(self):
+        pass
+
+
+def test_interrupted_unpack(tmpdir, monkeypatch):
+    members = [('%s_b%d.tif' % (FOLDER, i), os.urandom(20000))
+               for i in range(3)]
+    content = make_archive(members)
+    monkeypatch.setattr(requests, 'get', lambda url, stream=True:
+                        FakeResponse(content, fail_after=len(content) // 2))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        url_retrieve_and_unpack(URL, str(tmpdir))
+    # Nothing is left behind, not even the temporary directory
+    assert tmpdir.listdir() == []
+    monkeypatch.setattr(requests, 'get', lambda url, stream=True:
+                        FakeResponse(content))
+    path = url_retrieve_and_unpack(URL, str(tmpdir))
+    assert path == os.path.join(str(tmpdir), FOLDER)
+    assert sorted(os.listdir(path)) == [name for name, _ in members]
+    for name, data in members:
+        with open(os.path.join(path, name), 'rb') as src:
+            assert src.read() == data
+    assert [x.basename for x in tmpdir.listdir()] == [FOLDER]